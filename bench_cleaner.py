@@ -0,0 +1,125 @@
+"""Micro-benchmark of content_cleaner against the original regex cleanup.
+
+Builds a fixture corpus of raw model responses (fenced and bare JSON objects
+and arrays, Markdown and text documents with preambles and trailers), checks
+that both cleaners agree on every fixture, then times each:
+
+    python bench_cleaner.py --docs 5000 --repeat 5
+
+Pass --corpus to benchmark against files already under a directory instead.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+from content_cleaner import clean_content, find_documents, json_start
+
+# The cleanup generate_synthetic_data.py used before content_cleaner, kept as the reference
+def legacy_clean(content, format_type):
+    if format_type == ".json":
+        json_matches = re.findall(r'```(?:json)?(.*?)```', content, re.DOTALL)
+        if json_matches:
+            return json_matches[0].strip()
+        start_idx = json_start(content)
+        if start_idx >= 0:
+            closer = '}' if content[start_idx] == '{' else ']'
+            end_idx = content.rfind(closer) + 1
+            if start_idx < end_idx:
+                return content[start_idx:end_idx]
+    elif format_type == ".md":
+        content = re.sub(r'```markdown|```md|```', '', content)
+        content = re.sub(r'^Here\'s a (?:realistic|sample) .*?:\s*', '', content, flags=re.IGNORECASE | re.DOTALL)
+    elif format_type == ".txt":
+        content = re.sub(r'^Here\'s a (?:simulated|sample) .*?:\s*', '', content, flags=re.IGNORECASE | re.DOTALL)
+    content = re.sub(r'^Here\'s a (?:realistic|sample) .*?:\s*', '', content, flags=re.IGNORECASE)
+    content = re.sub(r'\nThis (?:JSON|document|content) provides.*$', '', content, flags=re.IGNORECASE | re.DOTALL)
+    return content.strip()
+
+WORDS = ("client therapist session intake billing insurance follow-up schedule provider "
+         "referral outcome survey copay telehealth licensed matching onboarding").split()
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+
+# One raw response in `format_type`, wrapped the way the model tends to wrap it
+def fixture(rng, format_type):
+    trailer = "\n\nThis document provides a realistic example of the requested content." if rng.random() < 0.5 else ""
+    if format_type == ".json":
+        lines = [{"name": rng.choice(WORDS), "time": "2024-03-01T10:00:00Z", "content": sentence(rng)}
+                 for _ in range(rng.randint(5, 40))]
+        body = json.dumps({"call_id": str(rng.getrandbits(32)), "lines": lines} if rng.random() < 0.5 else lines,
+                          indent=2)
+        if rng.random() < 0.5:
+            body = f"```json\n{body}\n```"
+        return f"Here's a realistic JSON transcript:\n\n{body}{trailer.replace('document', 'JSON')}"
+    paragraphs = "\n\n".join(sentence(rng) for _ in range(rng.randint(5, 40)))
+    if format_type == ".md":
+        return f"Here's a sample meeting notes document:\n\n```markdown\n# Notes\n\n{paragraphs}\n```{trailer}"
+    return f"Here's a simulated Slack conversation:\n\n{paragraphs}{trailer}"
+
+def build_corpus(docs, seed):
+    rng = random.Random(seed)
+    return [(format_type, fixture(rng, format_type))
+            for format_type in (rng.choice((".json", ".md", ".txt")) for _ in range(docs))]
+
+def load_corpus(root):
+    corpus = []
+    for path in find_documents([root]):
+        with open(path, 'r') as f:
+            corpus.append((os.path.splitext(path)[1], f.read()))
+    return corpus
+
+# Best wall time of `repeat` passes of `clean` over the corpus
+def time_cleaner(clean, corpus, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for format_type, content in corpus:
+            clean(content, format_type)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark the output cleaner against the original implementation')
+
+    parser.add_argument('--docs', type=int, default=5000,
+                        help='Fixture documents to generate (default: 5000)')
+
+    parser.add_argument('--corpus',
+                        help='Benchmark the documents under this directory instead of generated fixtures')
+
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Timed passes per cleaner; the best is reported (default: 5)')
+
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the fixture corpus (default: 0)')
+
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    corpus = load_corpus(args.corpus) if args.corpus else build_corpus(args.docs, args.seed)
+    if not corpus:
+        print("No documents to benchmark.")
+        return 1
+    megabytes = sum(len(content.encode("utf-8")) for _, content in corpus) / 1e6
+
+    mismatches = [i for i, (format_type, content) in enumerate(corpus)
+                  if clean_content(content, format_type) != legacy_clean(content, format_type)]
+    print(f"{len(corpus)} documents, {megabytes:.1f} MB; {len(mismatches)} differ from the original cleaner")
+
+    legacy = time_cleaner(legacy_clean, corpus, args.repeat)
+    current = time_cleaner(clean_content, corpus, args.repeat)
+    for name, elapsed in (("original", legacy), ("content_cleaner", current)):
+        print(f"{name:>16}: {elapsed * 1000:8.1f} ms  ({len(corpus) / elapsed:,.0f} docs/s, "
+              f"{megabytes / elapsed:.1f} MB/s)")
+    print(f"Speedup: {legacy / current:.2f}x")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""End-to-end throughput benchmark of the generation CLI against the mock API.
+
+Starts mock_server in-process, then runs generate_synthetic_data.py as a
+subprocess for every combination of --concurrency and --docs, each into its
+own temporary output tree, and reads back the run report it writes:
+
+    python bench_pipeline.py --concurrency 1 4 16 --docs 50 200 --latency 0.2
+    python bench_pipeline.py --save baseline.json
+    python bench_pipeline.py --baseline baseline.json --max-regression 0.2
+
+With --baseline the exit status is non-zero when any case's docs/s falls
+more than --max-regression below the baseline, so the benchmark can gate
+changes the way a test would. Mock latency, errors and content are seeded,
+so repeated runs see the same workload.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock_server
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(REPO_DIR, "generate_synthetic_data.py")
+
+# Inputs of the default company, written into a companies manifest per case
+COMPANY = {
+    "name": "SonderMind",
+    "slug": "sondermind",
+    "profile": os.path.join(REPO_DIR, "sondermind_company_profile.md"),
+    "file_types": os.path.join(REPO_DIR, "file_generation_types.json"),
+    "themes": os.path.join(REPO_DIR, "generation_themes.csv"),
+    "platforms_key": "sondermind_platforms",
+    "customers": "therapists and clients",
+}
+
+# Run the CLI once for `docs` documents at `concurrency`; returns the case's results
+def run_case(base_url, concurrency, docs, extra_args, keep):
+    workdir = tempfile.mkdtemp(prefix=f"bench-c{concurrency}-d{docs}-")
+    companies = os.path.join(workdir, "companies.json")
+    with open(companies, 'w') as f:
+        json.dump([{**COMPANY, "output": os.path.join(workdir, "output")}], f)
+    report_path = os.path.join(workdir, "run_report.json")
+
+    command = [
+        sys.executable, SCRIPT,
+        "--companies", companies,
+        "--total", str(docs),
+        "--concurrency", str(concurrency),
+        "--seed", "0",
+        "--report", report_path,
+        "--manifest", os.path.join(workdir, "manifest.jsonl"),
+        "--journal", os.path.join(workdir, "journal.sqlite3"),
+        "--token-budgets", os.path.join(workdir, "token_budgets.json"),
+        *extra_args,
+    ]
+    env = {**os.environ, "ANTHROPIC_BASE_URL": base_url, "ANTHROPIC_API_KEY": "mock-key"}
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=REPO_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True)
+    wall = time.perf_counter() - start
+
+    if not os.path.exists(report_path):
+        print(completed.stdout[-2000:])
+        raise RuntimeError(f"run with concurrency {concurrency}, {docs} docs wrote no report")
+    with open(report_path, 'r') as f:
+        report = json.load(f)
+    if not keep:
+        shutil.rmtree(workdir)
+
+    stages = report["stages"]
+    return {
+        "concurrency": concurrency,
+        "docs": docs,
+        "exit_code": completed.returncode,
+        "wall_seconds": round(wall, 3),
+        "generated": report["docs"],
+        "errors": report["errors"],
+        "retries": report["rate_limiting"]["retries"],
+        "docs_per_second": report["docs_per_second"],
+        "tokens_per_second": report["tokens_per_second"],
+        "api_p50": stages.get("api", {}).get("p50"),
+        "total_p50": stages.get("total", {}).get("p50"),
+        "total_p99": stages.get("total", {}).get("p99"),
+        # Time a job spends in the pipeline itself rather than waiting on the API
+        "overhead_p50": (round(stages["total"]["p50"] - stages["api"]["p50"], 4)
+                         if "total" in stages and "api" in stages else None),
+    }
+
+# Cases whose throughput fell more than `max_regression` below the baseline
+def regressions(results, baseline, max_regression):
+    previous = {(case["concurrency"], case["docs"]): case for case in baseline["results"]}
+    found = []
+    for case in results:
+        before = previous.get((case["concurrency"], case["docs"]))
+        if before and before["docs_per_second"] and case["docs_per_second"] is not None:
+            if case["docs_per_second"] < before["docs_per_second"] * (1 - max_regression):
+                found.append((case, before))
+    return found
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark the generation CLI against a local mock API')
+
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help='Concurrency levels to run (default: 1 4 16)')
+
+    parser.add_argument('--docs', type=int, nargs='+', default=[50],
+                        help='Corpus sizes to run (default: 50)')
+
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='Mean mock response latency in seconds (default: 0.2)')
+
+    parser.add_argument('--latency-dist', choices=mock_server.LATENCY_DISTRIBUTIONS, default='lognormal',
+                        help='Mock latency distribution (default: lognormal)')
+
+    parser.add_argument('--latency-jitter', type=float, default=0.1,
+                        help='Spread of the mock latency distribution in seconds (default: 0.1)')
+
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='Share of mock requests answered with 429 (default: 0)')
+
+    parser.add_argument('--server-error-rate', type=float, default=0.0,
+                        help='Share of mock requests answered with 500 (default: 0)')
+
+    parser.add_argument('--overload-rate', type=float, default=0.0,
+                        help='Share of mock requests answered with 529 (default: 0)')
+
+    parser.add_argument('--save',
+                        help='Write the results as JSON, e.g. to use as a later --baseline')
+
+    parser.add_argument('--baseline',
+                        help='Results JSON from an earlier run to compare throughput against')
+
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed fractional drop in docs/s against --baseline (default: 0.2)')
+
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep each case\'s temporary output tree')
+
+    args, cli_args = parser.parse_known_args()
+    # Anything unrecognised is passed through to generate_synthetic_data.py, e.g. --stream
+    args.cli_args = cli_args
+    return args
+
+def main():
+    args = parse_arguments()
+    mock_args = mock_server.parse_arguments([
+        "--port", "0",
+        "--latency", str(args.latency),
+        "--latency-dist", args.latency_dist,
+        "--latency-jitter", str(args.latency_jitter),
+        "--rate-limit-rate", str(args.rate_limit_rate),
+        "--server-error-rate", str(args.server_error_rate),
+        "--overload-rate", str(args.overload_rate),
+        "--retry-after", "0.1",
+        "--seed", "0",
+    ])
+    server = mock_server.start_server(mock_args)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Mock API at {base_url}: {args.latency}s {args.latency_dist} latency")
+
+    results = []
+    try:
+        for docs in args.docs:
+            for concurrency in args.concurrency:
+                case = run_case(base_url, concurrency, docs, args.cli_args, args.keep)
+                results.append(case)
+                print(f"concurrency {concurrency:>3}, {docs:>5} docs: {case['docs_per_second'] or 0:8.2f} docs/s, "
+                      f"p50 {case['total_p50'] or 0:.3f}s (API {case['api_p50'] or 0:.3f}s, "
+                      f"overhead {case['overhead_p50'] or 0:.4f}s), p99 {case['total_p99'] or 0:.3f}s, "
+                      f"{case['errors']} errors, {case['retries']} retries")
+    finally:
+        server.shutdown()
+        print(mock_server.stats_summary())
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({"latency": args.latency, "latency_dist": args.latency_dist, "results": results}, f, indent=2)
+        print(f"Results written to {args.save}")
+
+    failed = [case for case in results if case["exit_code"] != 0]
+    for case in failed:
+        print(f"Run with concurrency {case['concurrency']}, {case['docs']} docs exited with {case['exit_code']}")
+
+    slower = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            slower = regressions(results, json.load(f), args.max_regression)
+        for case, before in slower:
+            print(f"Regression: concurrency {case['concurrency']}, {case['docs']} docs at "
+                  f"{case['docs_per_second']:.2f} docs/s vs {before['docs_per_second']:.2f} in the baseline")
+        if not slower:
+            print(f"No throughput regressions beyond {args.max_regression:.0%} of the baseline")
+    return 1 if failed or slower else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Cold-start budget for the generation CLI.
+
+Runs each CLI entry point with `python -X importtime` and sums the import
+time of its top-level modules, best of --repeat runs:
+
+    python bench_startup.py
+    python bench_startup.py --budget-ratio 3 --repeat 5
+
+Short worker and plan-only invocations pay this on every launch, so the
+exit status is non-zero when any command imports one of LAZY_MODULES, which
+should only load once a run actually calls the API, writes a Parquet/Arrow
+label store or enters the mode that needs them, or goes over its time
+budget. Import times swing with machine load, so the budget is relative: a
+multiple of BASELINE, the imports every entry point pays before any repo
+module, measured the same way in the same session.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(REPO_DIR, "generate_synthetic_data.py")
+
+# Commands that must start without touching the network stack, by name; {tmp} is a scratch directory
+COMMANDS = (
+    ("--help", ["--help"]),
+    ("clean --help", ["clean", "--help"]),
+    ("dedup --help", ["dedup", "--help"]),
+    ("labels --help", ["labels", "--help"]),
+    ("--plan-only", ["--plan-only", "--plan", "{tmp}/plan.jsonl"]),
+)
+
+LAZY_MODULES = ("anthropic", "httpx", "dotenv", "pyarrow", "requests",
+                # Standard library modules only some modes need
+                "sqlite3", "tarfile", "email", "subprocess", "socket", "concurrent", "streaming")
+
+# Interpreter arguments for the floor every entry point pays: startup plus argparse and json
+BASELINE = ["-c", "import argparse, json"]
+
+# Default budget per command, as a multiple of BASELINE's import time; the commands measure about 2x
+DEFAULT_BUDGET_RATIO = 4.0
+
+# Cumulative import time in microseconds of each top-level module one run of `args` imports,
+# and the names of every module it imports, nested ones included
+def import_times(args):
+    result = subprocess.run([sys.executable, "-X", "importtime", *args],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, cwd=REPO_DIR)
+    modules = {}
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        imported.add(name.strip().split(".")[0])
+        # Nested imports are indented under the module that triggered them
+        if not name.startswith("  "):
+            modules[name.strip()] = int(cumulative)
+    return modules, imported
+
+# Fastest of `repeat` runs by total import time
+def measure(args, repeat):
+    best = None
+    for _ in range(repeat):
+        modules, imported = import_times(args)
+        if best is None or sum(modules.values()) < sum(best[0].values()):
+            best = modules, imported
+    return best
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Check the import time of the CLI entry points against a budget')
+
+    parser.add_argument('--budget-ratio', type=float, default=DEFAULT_BUDGET_RATIO,
+                        help=f'Largest total import time allowed per command, as a multiple of the baseline\'s '
+                             f'(default: {DEFAULT_BUDGET_RATIO:g})')
+
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per command; the fastest is reported (default: 3)')
+
+    parser.add_argument('--top', type=int, default=5,
+                        help='Slowest top-level imports listed per command (default: 5)')
+
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    failed = False
+    baseline_ms = sum(measure(BASELINE, args.repeat)[0].values()) / 1000
+    budget_ms = baseline_ms * args.budget_ratio
+    print(f"{'baseline':>16}: {baseline_ms:6.1f} ms imports")
+    scratch = tempfile.TemporaryDirectory(prefix="bench-startup-")
+    for name, command in COMMANDS:
+        modules, imported = measure([SCRIPT, *(arg.format(tmp=scratch.name) for arg in command)], args.repeat)
+        total_ms = sum(modules.values()) / 1000
+        lazy = sorted(imported & set(LAZY_MODULES))
+        over = total_ms > budget_ms
+        failed = failed or over or bool(lazy)
+        status = "FAIL" if over or lazy else "ok"
+        print(f"{name:>16}: {total_ms:6.1f} ms imports, {len(modules)} modules  [{status}]")
+        slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print("                  slowest: " + ", ".join(f"{name} {us / 1000:.1f} ms" for name, us in slowest))
+        if lazy:
+            print(f"                  imported at startup: {', '.join(lazy)}")
+    scratch.cleanup()
+    print(f"Budget: {budget_ms:.1f} ms per command ({args.budget_ratio:g}x baseline)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
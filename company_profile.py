@@ -0,0 +1,106 @@
+"""Structured, cached model of a company profile document.
+
+The profile is scanned once for "**Heading**" lines (optionally prefixed with
+Markdown "#" markers). Named sections such as "users" or "costs" are found by
+heading prefix and run until the next named heading, so a profile may add,
+drop or reorder headings without breaking anything; a missing section is
+simply absent. Every heading is also reachable by its slug.
+
+load_profile() memoizes parsed profiles by path, modification time and size,
+and excerpts are truncated to a token budget on a token boundary and cached,
+so many prompts, or many profiles, pay the parsing cost once.
+"""
+import os
+import re
+import threading
+
+HEADING_PATTERN = re.compile(r'^[ \t]*(?:#{1,6}[ \t]*)?\*\*(.+?)\*\*[ \t]*$', re.MULTILINE)
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+# Named sections and the heading prefixes that identify them
+DEFAULT_SECTION_ALIASES = {
+    "overview": ["Overview"],
+    "users": ["Users"],
+    "competitors": ["Competitors"],
+    "services": ["Services/Products", "Services", "Products"],
+    "costs": ["Service Cost Structure", "Cost Structure", "Pricing"],
+    "feedback": ["User Feedback", "Customer Feedback"],
+    "outreach": ["Outreach and Onboarding", "Outreach"],
+}
+
+# Default size of a profile excerpt; roughly the old 500-character cut
+DEFAULT_EXCERPT_TOKENS = 90
+
+def slugify(title):
+    return re.sub(r'[^a-z0-9]+', '_', title.lower()).strip('_')
+
+class CompanyProfile:
+    def __init__(self, text, aliases=DEFAULT_SECTION_ALIASES):
+        self.text = text
+        headings = [(match.group(1).strip(), match.start(), match.end()) for match in HEADING_PATTERN.finditer(text)]
+
+        # Every heading by slug, running to the next heading of any kind
+        self.headings = {}
+        for i, (title, _, body_start) in enumerate(headings):
+            end = headings[i + 1][1] if i + 1 < len(headings) else len(text)
+            self.headings.setdefault(slugify(title), text[body_start:end].strip())
+
+        # Named sections: first heading matching each alias, running to the next named heading
+        named = []
+        for name, prefixes in aliases.items():
+            for title, start, body_start in headings:
+                if any(title.lower().startswith(prefix.lower()) for prefix in prefixes):
+                    named.append((start, body_start, name))
+                    break
+        named.sort()
+        self.sections = {}
+        for i, (_, body_start, name) in enumerate(named):
+            end = named[i + 1][0] if i + 1 < len(named) else len(text)
+            self.sections[name] = text[body_start:end].strip()
+
+        self._excerpts = {}
+
+    def __contains__(self, name):
+        return name in self.sections or name in self.headings
+
+    # Full text of a named section or heading slug, or None
+    def section(self, name):
+        if name in self.sections:
+            return self.sections[name]
+        return self.headings.get(name)
+
+    # Section text cut to roughly `max_tokens` tokens
+    def excerpt(self, name, max_tokens=DEFAULT_EXCERPT_TOKENS):
+        key = (name, max_tokens)
+        if key not in self._excerpts:
+            text = self.section(name)
+            self._excerpts[key] = truncate_tokens(text, max_tokens) if text is not None else None
+        return self._excerpts[key]
+
+# Cut `text` after `max_tokens` word/punctuation tokens, ending on a token boundary
+def truncate_tokens(text, max_tokens):
+    for count, match in enumerate(TOKEN_PATTERN.finditer(text), 1):
+        if count == max_tokens:
+            end = match.end()
+            if end >= len(text.rstrip()):
+                return text
+            return text[:end].rstrip()
+    return text
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+# Parsed profile for `path`, re-parsed only when the file changes
+def load_profile(path, aliases=DEFAULT_SECTION_ALIASES):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _profiles_lock:
+        profile = _profiles.get(key)
+        if profile is None:
+            with open(path, 'r') as f:
+                profile = CompanyProfile(f.read(), aliases)
+            # Drop parses of older versions of the same file
+            for stale in [cached for cached in _profiles if cached[0] == key[0]]:
+                del _profiles[stale]
+            _profiles[key] = profile
+        return profile
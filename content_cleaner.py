@@ -0,0 +1,148 @@
+"""Precompiled, single-pass cleanup of generated documents.
+
+clean_content() strips what the model wraps around a document: JSON is cut
+to its first fenced block or to the outermost object or array, Markdown
+fences are removed, a leading "Here's a ..." preamble is dropped and anything
+from a trailing "This JSON/document provides..." line onwards is discarded.
+Every pattern is compiled once at import and each format runs only the
+passes it needs. streaming.StreamingCleaner applies the same patterns one
+line at a time, so a preamble there cannot span lines.
+
+The same cleanup can be re-applied to an existing output tree, in parallel
+across processes:
+
+    python generate_synthetic_data.py clean output/ --jobs 8
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+JSON_FENCE_PATTERN = re.compile(r'```(?:json)?')
+JSON_BLOCK_PATTERN = re.compile(JSON_FENCE_PATTERN.pattern + r'(.*?)```', re.DOTALL)
+MARKDOWN_FENCE_PATTERN = re.compile(r'```markdown|```md|```')
+
+# A line starting like this, other than the document's first, begins the trailer. Whole documents
+# are searched for it after a newline, which keeps the search on the fast literal-prefix scan
+TRAILER_PATTERN = re.compile(r'This (?:JSON|document|content) provides', re.IGNORECASE)
+TRAILER_LINE_PATTERN = re.compile('\n' + TRAILER_PATTERN.pattern, re.IGNORECASE)
+
+# Markdown and text preambles may span lines up to their colon; others stop at the line end
+PREAMBLE_PATTERNS = {
+    ".md": re.compile(r"^Here's a (?:realistic|sample) .*?:\s*", re.IGNORECASE | re.DOTALL),
+    ".txt": re.compile(r"^Here's a (?:(?:simulated|sample) .*?|realistic [^\n]*?):\s*", re.IGNORECASE | re.DOTALL),
+}
+DEFAULT_PREAMBLE_PATTERN = re.compile(r"^Here's a (?:realistic|sample) [^\n]*?:\s*", re.IGNORECASE)
+
+# File extensions the cleaner knows how to handle
+CLEANED_FORMATS = (".json", ".md", ".txt")
+
+# Index of the first "{" or "[" in `text`, or -1
+def json_start(text):
+    starts = [index for index in (text.find('{'), text.find('[')) if index >= 0]
+    return min(starts) if starts else -1
+
+# Clean up LLM-generated content to remove explanatory text
+def clean_content(content, format_type):
+    if format_type == ".json":
+        match = JSON_BLOCK_PATTERN.search(content)
+        if match:
+            return match.group(1).strip()
+        start = json_start(content)
+        if start >= 0:
+            end = content.rfind('}' if content[start] == '{' else ']') + 1
+            if start < end:
+                return content[start:end]
+        # No JSON found: fall through to the general cleanup
+    elif format_type == ".md":
+        content = MARKDOWN_FENCE_PATTERN.sub('', content)
+
+    content = PREAMBLE_PATTERNS.get(format_type, DEFAULT_PREAMBLE_PATTERN).sub('', content, count=1).strip()
+    trailer = TRAILER_LINE_PATTERN.search(content)
+    if trailer:
+        content = content[:trailer.start()].rstrip()
+    return content
+
+# Re-clean one file in place; returns True if it changed
+def clean_file(path, dry_run=False):
+    with open(path, 'r') as f:
+        content = f.read()
+    cleaned = clean_content(content, os.path.splitext(path)[1])
+    if cleaned == content:
+        return False
+    if not dry_run:
+        tmp_path = f"{path}.part"
+        with open(tmp_path, 'w') as f:
+            f.write(cleaned)
+        os.replace(tmp_path, path)
+    return True
+
+# Generated documents are laid out as <platform>/<type>/<shard>/<type>_<index><ext> below an output
+# root, which may itself sit in a company directory. Returns the (platform, type) directories of such
+# a path, or None for anything else found under a root: run reports, token budgets, plans
+def document_location(path):
+    parts = os.path.normpath(path).split(os.sep)
+    if len(parts) < 4:
+        return None
+    platform, doc_type, shard, name = parts[-4:]
+    stem, ext = os.path.splitext(name)
+    index = stem[len(doc_type) + 1:]
+    if ext not in CLEANED_FORMATS or not shard.isdigit() or not stem.startswith(f"{doc_type}_") or not index.isdigit():
+        return None
+    return platform, doc_type
+
+# Every generated document under `roots`; files named directly are taken as they are
+def find_documents(roots):
+    for root in roots:
+        if os.path.isfile(root):
+            yield root
+            continue
+        for directory, _, names in os.walk(root):
+            for name in sorted(names):
+                path = os.path.join(directory, name)
+                if document_location(path):
+                    yield path
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog='generate_synthetic_data.py clean',
+                                     description='Re-apply output cleanup to existing generated documents')
+
+    parser.add_argument('paths', nargs='*', default=['output'],
+                        help='Files or directories to clean (default: output)')
+
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: number of CPUs)')
+
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Report the files that would change without rewriting them')
+
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    return args
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    paths = list(find_documents(args.paths))
+    start = time.perf_counter()
+
+    if args.jobs == 1:
+        changed = [clean_file(path, args.dry_run) for path in paths]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            changed = list(executor.map(clean_file, paths, [args.dry_run] * len(paths),
+                                        chunksize=max(1, len(paths) // (args.jobs * 4))))
+
+    elapsed = time.perf_counter() - start
+    for path, was_changed in zip(paths, changed):
+        if was_changed:
+            print(f"{'Would clean' if args.dry_run else 'Cleaned'}: {path}")
+    rate = len(paths) / elapsed if elapsed else 0.0
+    print(f"{sum(changed)} of {len(paths)} files {'need' if args.dry_run else 'needed'} cleaning "
+          f"({elapsed:.2f}s, {rate:.0f} files/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Packed, compressed corpus output with a random-access offset index.
+
+Instead of one small file per document, documents are appended to
+size-bounded shard files under the output root. Each shard is a series of
+independently gzip-compressed blocks of about BLOCK_BYTES of documents, so
+the shard as a whole is an ordinary .gz file (zcat, tar -xzf) while a single
+document is read by decompressing only its block.
+
+Two layouts are supported:
+
+    jsonl   corpus-00000.jsonl.gz, one JSON record (metadata + "content") per line
+    tar     corpus-00000.tar.gz, one tar member per document under its usual path
+
+index.jsonl in the output root records, for every document, its shard, the
+byte offset and compressed size of its block, and its offset and length
+inside the decompressed block; read_document() uses that to fetch one
+document. A document's callback only fires once its block is on disk, so the
+run journal never marks a document done that a crash could still lose.
+"""
+import glob
+import io
+import json
+import os
+import re
+import threading
+import zlib
+
+SHARD_KINDS = {"jsonl": ".jsonl.gz", "tar": ".tar.gz"}
+
+# Uncompressed bytes gathered before a block is compressed and written
+BLOCK_BYTES = 64 * 1024
+
+# Default upper bound on the compressed size of one shard
+DEFAULT_SHARD_BYTES = 256 * 1024 * 1024
+
+INDEX_NAME = "index.jsonl"
+
+def gzip_block(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+class ShardWriter:
+    def __init__(self, root, kind="jsonl", max_bytes=DEFAULT_SHARD_BYTES, append=False):
+        if kind not in SHARD_KINDS:
+            raise ValueError(f"unknown shard kind {kind!r}")
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.kind = kind
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"documents": 0, "blocks": 0, "shards": 0, "raw_bytes": 0, "packed_bytes": 0}
+
+        pattern = re.compile(rf"corpus-(\d+){re.escape(SHARD_KINDS[kind])}$")
+        existing = sorted(int(match.group(1)) for match in
+                          (pattern.search(path) for path in glob.glob(os.path.join(root, "corpus-*")))
+                          if match)
+        if append:
+            # Never touch shards an earlier run already indexed
+            self.shard_number = existing[-1] + 1 if existing else 0
+        else:
+            for number in existing:
+                os.remove(self.shard_path(number))
+            self.shard_number = 0
+        self.index = open(os.path.join(root, INDEX_NAME), 'a' if append else 'w')
+        self.shard = None
+        self.buffer = io.BytesIO()
+        self.pending = []
+
+    def shard_path(self, number):
+        return os.path.join(self.root, f"corpus-{number:05d}{SHARD_KINDS[self.kind]}")
+
+    # Queue one document; `on_written(entry)` is called once it is durably in a shard
+    def add(self, doc_id, name, content, metadata=None, on_written=None):
+        if self.kind == "jsonl":
+            record = {"id": doc_id, "name": name, **(metadata or {}), "content": content}
+            header = b""
+            data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            padding = b""
+        else:
+            # tarfile is slow to import and only needed for tar shards
+            import tarfile
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            header = info.tobuf(format=tarfile.PAX_FORMAT)
+            padding = b"\0" * (-len(data) % tarfile.BLOCKSIZE)
+
+        with self.lock:
+            self.buffer.write(header)
+            entry = {"id": doc_id, "name": name, "offset": self.buffer.tell(), "length": len(data)}
+            self.buffer.write(data + padding)
+            self.pending.append((entry, on_written))
+            self.stats["documents"] += 1
+            if self.buffer.tell() >= BLOCK_BYTES:
+                self._flush_block()
+
+    # Compress the buffered documents into one block, index them and run their callbacks
+    def _flush_block(self):
+        raw = self.buffer.getvalue()
+        if not raw:
+            return
+        block = gzip_block(raw)
+        if self.shard is None or (self.shard.tell() and self.shard.tell() + len(block) > self.max_bytes):
+            self._next_shard()
+        shard_name = os.path.basename(self.shard.name)
+        block_offset = self.shard.tell()
+        self.shard.write(block)
+        self.shard.flush()
+        os.fsync(self.shard.fileno())
+
+        for entry, _ in self.pending:
+            entry.update(shard=shard_name, block_offset=block_offset, block_bytes=len(block))
+            self.index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.index.flush()
+        self.stats["blocks"] += 1
+        self.stats["raw_bytes"] += len(raw)
+        self.stats["packed_bytes"] += len(block)
+
+        pending, self.pending = self.pending, []
+        self.buffer = io.BytesIO()
+        for entry, on_written in pending:
+            if on_written is not None:
+                on_written(entry)
+
+    def _next_shard(self):
+        self._close_shard()
+        self.shard = open(self.shard_path(self.shard_number), 'wb')
+        self.shard_number += 1
+        self.stats["shards"] += 1
+
+    def _close_shard(self):
+        if self.shard is not None:
+            if self.kind == "tar":
+                import tarfile
+                # End-of-archive marker so the shard extracts cleanly with tar
+                self.shard.write(gzip_block(b"\0" * (2 * tarfile.BLOCKSIZE)))
+            self.shard.close()
+            self.shard = None
+
+    def close(self):
+        with self.lock:
+            self._flush_block()
+            self._close_shard()
+            self.index.close()
+
+    def summary(self):
+        stats = self.stats
+        ratio = stats["raw_bytes"] / stats["packed_bytes"] if stats["packed_bytes"] else 0.0
+        return (f"Packed {stats['documents']} documents into {stats['shards']} {self.kind} shard(s), "
+                f"{stats['blocks']} blocks, {stats['packed_bytes'] / 1e6:.1f} MB ({ratio:.1f}x compression) "
+                f"in {self.root}")
+
+# Index entries of a packed output root, by document id
+def read_index(root):
+    entries = {}
+    with open(os.path.join(root, INDEX_NAME), 'r') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry["id"]] = entry
+    return entries
+
+# Content of one indexed document, decompressing only its block
+def read_document(root, entry):
+    with open(os.path.join(root, entry["shard"]), 'rb') as f:
+        f.seek(entry["block_offset"])
+        block = zlib.decompress(f.read(entry["block_bytes"]), 31)
+    data = block[entry["offset"]:entry["offset"] + entry["length"]].decode("utf-8")
+    if entry["shard"].endswith(SHARD_KINDS["jsonl"]):
+        return json.loads(data)["content"]
+    return data
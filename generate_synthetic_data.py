@@ -2,641 +2,1524 @@ import json
 import csv
 import os
 import random
-import requests
 import time
 import argparse
-from datetime import datetime, timedelta
-import anthropic
-import dotenv
 import sys
-import re
+import threading
+import itertools
+import hashlib
+from rate_limiter import RateLimiter, RETRYABLE_STATUS_CODES, parse_retry_after, backoff_delay
+from response_cache import ResponseCache, CACHE_MODES
+from manifest import ManifestWriter
+from message_batches import BatchClient, MAX_BATCH_REQUESTS, load_batch_state, save_batch_state
+from run_journal import RunJournal
+from corpus_shards import ShardWriter, DEFAULT_SHARD_BYTES
+from job_queue import JobQueue, LeaseHeartbeat, DEFAULT_LEASE_SECONDS
+from run_report import RunReport, ProgressLine
+import content_cleaner
+from content_cleaner import clean_content
+from json_validation import check_document, load_schema
+import near_duplicates
+from near_duplicates import NearDuplicateIndex, DEDUP_MODES
+from token_budgets import TokenBudgets, MAX_OUTPUT_TOKENS
+import label_store
+from label_store import export_labels, label_format
+from input_fingerprints import digest, fingerprint, latest_records, recorded_seed, diff_plan
+from platform_registry import build_registry, render_prompt
+from company_profile import load_profile, slugify
 
-# Load environment variables
-dotenv.load_dotenv()
+# Company generated for when no --companies manifest is given
+DEFAULT_COMPANY = {
+    "name": "SonderMind",
+    "slug": "sondermind",
+    "profile": "sondermind_company_profile.md",
+    "file_types": "file_generation_types.json",
+    "themes": "generation_themes.csv",
+    "platforms_key": "sondermind_platforms",
+    "description": ("SonderMind is a technology-driven behavioral health company that connects individuals "
+                    "with licensed therapists and psychiatrists.\n"
+                    "They offer both virtual and in-person therapy services with a focus on personalized care."),
+    "customers": "therapists and clients",
+    "output": "output",
+    "quota": None,
+}
+
+# Model used for every generation request
+MODEL = "claude-3-5-sonnet-20240620"
+
+# Beta header enabling cache_control on the static system prompt
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+
+# Default number of repair requests for a JSON document that fails validation
+DEFAULT_JSON_REPAIRS = 1
+
+# Default location of the near-duplicate index used by --dedup
+DEFAULT_DEDUP_INDEX_PATH = "output/.dedup.sqlite3"
+
+# Appended to the prompt when --dedup regenerate asks again for a near-duplicate document
+DIVERSITY_NOTE = ("\n\nOther {doc_type} documents in this set came out nearly identical. Make this one clearly "
+                  "distinct: use different people, specifics, structure and wording.")
+
+# Written in place of a document when no API key is set, so a demo run still produces every file
+PLACEHOLDER_RESPONSE = "[PLACEHOLDER] Synthetic data would be generated based on the prompt."
+
+# max_tokens for a document type until its budget has been learned from observed output lengths
+DEFAULT_MAX_TOKENS = 2500
+
+# Where learned per-type token budgets are kept between runs
+DEFAULT_TOKEN_BUDGETS_PATH = "output/token_budgets.json"
+
+# Follow-up requests allowed to finish a response cut off at max_tokens
+DEFAULT_MAX_CONTINUATIONS = 2
+
+# Default location of the on-disk response cache
+DEFAULT_CACHE_PATH = ".cache/responses.sqlite3"
+
+# Documents per shard directory, so no directory holds more than this many files
+DOCS_PER_SHARD = 1000
+
+# Default location of the per-run document manifest
+DEFAULT_MANIFEST_PATH = "output/manifest.jsonl"
+
+# Default location of the job status journal used by --resume
+DEFAULT_JOURNAL_PATH = "output/.journal.sqlite3"
+
+# Default location of the shared job queue used by --workers, --enqueue and --worker
+DEFAULT_QUEUE_PATH = "output/queue.sqlite3"
+
+# Default location of the JSON run report
+DEFAULT_REPORT_PATH = "output/run_report.json"
+
+# Default seconds between --progress lines
+DEFAULT_PROGRESS_INTERVAL = 5.0
+
+# Default location of the job plan written by --plan-only
+DEFAULT_PLAN_PATH = "output/plan.jsonl"
+
+# Default number of generation jobs in flight at once
+DEFAULT_CONCURRENCY = 4
+
+# Default number of retries for throttled or failed API calls
+DEFAULT_MAX_RETRIES = 5
+
+# Where --batch runs record submitted batches so polling can be resumed
+DEFAULT_BATCH_STATE_PATH = "output/.batches.json"
+
+# Seconds between Message Batches status polls
+DEFAULT_POLL_INTERVAL = 30.0
+
+# Shared Anthropic client settings; the client itself is built on first use
+client_settings = {
+    "api_key": None,
+    "base_url": None,
+    "pool_size": DEFAULT_CONCURRENCY,
+    "max_retries": DEFAULT_MAX_RETRIES,
+    "prompt_cache": True,
+    "max_continuations": DEFAULT_MAX_CONTINUATIONS,
+}
+_client = None
+_client_lock = threading.Lock()
+
+# Process-wide request/token budgets; unlimited until configured
+rate_limiter = RateLimiter()
+
+# Response cache shared by all workers; None when --cache is off
+response_cache = None
+
+# JSON validation outcomes and time spent validating
+validation_stats = {"documents": 0, "checks": 0, "invalid": 0, "repaired": 0, "failed": 0, "seconds": 0.0}
+_validation_lock = threading.Lock()
+validation_settings = {"repairs": DEFAULT_JSON_REPAIRS}
+
+# max_tokens per document type, learned from the output lengths seen so far
+token_budgets = TokenBudgets(default=DEFAULT_MAX_TOKENS)
+
+# Near-duplicate index checked as documents are written; None unless --dedup is on
+dedup_index = None
+dedup_stats = {"documents": 0, "duplicates": 0, "regenerated": 0}
+_dedup_lock = threading.Lock()
+dedup_settings = {"mode": "off"}
+
+# Input token usage across the run, split by prompt-cache outcome
+usage_stats = {"input_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0, "output_tokens": 0}
+_usage_lock = threading.Lock()
+
+# Stage timings, per-type token usage and costs for the run report
+report = RunReport(MODEL)
+
+# Manifest of written documents; None until a run opens it
+manifest = None
+
+# Job status journal; None until a run opens it
+journal = None
+
+# Packed output writers by output root; empty when writing one file per document
+shard_writers = {}
+
+# --output-format choices and the shard layout each one packs into
+OUTPUT_FORMATS = {"files": None, "jsonl": "jsonl", "shards": "tar"}
 
 # Create output directories
-def create_directories(platforms):
+def create_directories(platforms, root="output"):
+    for platform in platforms:
+        os.makedirs(f"{root}/{platform}", exist_ok=True)
+
+# Filesystem-safe name for a document type
+def doc_slug(doc_type):
+    return doc_type.replace(' ', '_').lower()
+
+# Stable identifier of the index-th document of a type
+def document_id(company_slug, platform, doc_type, index):
+    return f"{company_slug}/{platform.lower()}/{doc_slug(doc_type)}/{index:06d}"
+
+# Indexed output path, sharded into subdirectories of DOCS_PER_SHARD files
+def document_filename(platform, doc_type, format_type, index, root="output"):
+    slug = doc_slug(doc_type)
+    return f"{root}/{platform}/{slug}/{index // DOCS_PER_SHARD:04d}/{slug}_{index:06d}{format_type}"
+
+# Number of file types each platform will generate, honouring --count
+def count_file_types(registry, platforms, count=None):
+    total = 0
     for platform in platforms:
-        os.makedirs(f"output/{platform}", exist_ok=True)
+        available = len(registry[platform])
+        total += min(count, available) if count else available
+    return total
 
 # Load file generation types
-def load_file_generation_types():
-    with open('file_generation_types.json', 'r') as f:
+def load_file_generation_types(path='file_generation_types.json'):
+    with open(path, 'r') as f:
         return json.load(f)
 
 # Load themes
-def load_themes():
+def load_themes(path='generation_themes.csv'):
     themes = []
-    with open('generation_themes.csv', 'r') as f:
+    with open(path, 'r') as f:
         reader = csv.DictReader(f)
         for row in reader:
             themes.append(row)
     return themes
 
-# Load company profile
-def load_company_profile():
-    with open('sondermind_company_profile.md', 'r') as f:
-        return f.read()
+# Load company profile, parsed into named sections
+def load_company_profile(path='sondermind_company_profile.md'):
+    return load_profile(path)
+
+# Who a company's representatives deal with, for companies that do not say
+DEFAULT_CUSTOMERS = "customers"
+
+# Load the companies to generate for from a JSON manifest; input paths are relative to it
+def load_companies(path=None):
+    if path is None:
+        return [dict(DEFAULT_COMPANY)]
+    with open(path, 'r') as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = entries["companies"]
+    
+    base_dir = os.path.dirname(path)
+    companies = []
+    for entry in entries:
+        slug = entry.get("slug") or slugify(entry["name"])
+        companies.append({
+            "name": entry["name"],
+            "slug": slug,
+            "profile": os.path.join(base_dir, entry["profile"]),
+            "file_types": os.path.join(base_dir, entry.get("file_types", DEFAULT_COMPANY["file_types"])),
+            "themes": os.path.join(base_dir, entry.get("themes", DEFAULT_COMPANY["themes"])),
+            "platforms_key": entry.get("platforms_key", f"{slug}_platforms"),
+            "description": entry.get("description"),
+            "customers": entry.get("customers", DEFAULT_CUSTOMERS),
+            "output": entry.get("output", f"output/{slug}"),
+            "quota": entry.get("quota"),
+        })
+    
+    slugs = [company["slug"] for company in companies]
+    duplicates = sorted({slug for slug in slugs if slugs.count(slug) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate company slug(s) in {path}: {', '.join(duplicates)}")
+    return companies
+
+# Resolve a company's registry; inputs shared between companies are loaded once
+def build_company_registry(company, loaded):
+    for key, loader in (("file_types", load_file_generation_types), ("themes", load_themes)):
+        if company[key] not in loaded:
+            loaded[company[key]] = loader(company[key])
+    profile = load_company_profile(company["profile"])
+    if not company["description"]:
+        # Fall back to the start of the profile's overview
+        company["description"] = profile.excerpt("overview", 60) or f"{company['name']} is a company."
+    return build_registry(loaded[company["file_types"]], loaded[company["themes"]], profile, company)
+
+# Round-robin over several job lists so no tenant waits behind another's whole queue
+def interleave(job_lists):
+    return [job for group in itertools.zip_longest(*job_lists) for job in group if job is not None]
+
+# Load ANTHROPIC_API_KEY and friends from a .env file, if there is one. Called on the first check
+# for an API key, so planning and fully cached runs never read it
+def load_environment():
+    import dotenv
+    dotenv.load_dotenv()
+
+# Configure the shared Anthropic client before the first API call
+def configure_client(base_url=None, pool_size=DEFAULT_CONCURRENCY, prompt_cache=True):
+    global _client
+    with _client_lock:
+        # Resolved by has_api_key() once a request actually needs it
+        client_settings["api_key"] = None
+        client_settings["base_url"] = base_url
+        client_settings["pool_size"] = pool_size
+        client_settings["prompt_cache"] = prompt_cache
+        _client = None
+
+# Configure client-side rate limits and the retry budget
+def configure_rate_limits(requests_per_minute=None, tokens_per_minute=None, max_retries=DEFAULT_MAX_RETRIES):
+    global rate_limiter
+    rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    client_settings["max_retries"] = max_retries
+
+# Load learned token budgets from `path`, or use `fixed` max_tokens for every request
+def configure_token_budgets(path=DEFAULT_TOKEN_BUDGETS_PATH, fixed=None, max_continuations=DEFAULT_MAX_CONTINUATIONS):
+    global token_budgets
+    token_budgets = TokenBudgets(path, DEFAULT_MAX_TOKENS, fixed)
+    client_settings["max_continuations"] = max_continuations
 
-# Generate synthetic data using Claude API
-def generate_with_claude(prompt, max_tokens=2500):
+# Open (or disable) the on-disk response cache
+def configure_cache(mode="off", path=DEFAULT_CACHE_PATH, max_mb=None, max_age_days=None):
+    global response_cache
+    if mode == "off":
+        response_cache = None
+        return
+    response_cache = ResponseCache(
+        path,
+        mode=mode,
+        max_bytes=int(max_mb * 1024 * 1024) if max_mb is not None else None,
+        max_age=max_age_days * 86400 if max_age_days is not None else None,
+    )
+
+def configure_dedup(mode="off", path=DEFAULT_DEDUP_INDEX_PATH, threshold=near_duplicates.DEFAULT_THRESHOLD,
+                    reset=False):
+    global dedup_index
+    dedup_settings["mode"] = mode
+    dedup_index = None if mode == "off" else NearDuplicateIndex(path, threshold, reset=reset)
+
+# Return the process-wide Anthropic client, backed by a keep-alive connection pool.
+# The SDK is imported on first use, so runs that never call the API start without it.
+def get_client():
+    global _client
+    has_api_key()
+    with _client_lock:
+        if _client is None:
+            import anthropic
+            import httpx
+            pool_size = client_settings["pool_size"]
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            )
+            _client = anthropic.Anthropic(
+                api_key=client_settings["api_key"] or None,
+                base_url=client_settings["base_url"],
+                http_client=http_client,
+                # Retries are handled by generate_with_claude so they respect the rate limiter
+                max_retries=0,
+            )
+        return _client
+
+# Messages API request body; the static system prompt is marked for prompt caching.
+# `prompt` is the user message, or a full list of messages for multi-turn requests.
+def message_params(prompt, system=None, max_tokens=DEFAULT_MAX_TOKENS):
+    params = {
+        "model": MODEL,
+        "max_tokens": max_tokens,
+        "messages": prompt if isinstance(prompt, list) else [
+            {"role": "user", "content": prompt}
+        ],
+    }
+    if system:
+        block = {"type": "text", "text": system}
+        # The API ignores the marker on prefixes shorter than the model's minimum (1024 tokens on Sonnet)
+        if client_settings["prompt_cache"]:
+            block["cache_control"] = {"type": "ephemeral"}
+        params["system"] = [block]
+    return params
+
+# All text sent in a request, for the pre-call token estimate
+def request_text(prompt, system=None):
+    if isinstance(prompt, list):
+        prompt = "".join(message["content"] for message in prompt)
+    return (system or "") + prompt
+
+# Extra HTTP headers for every request
+def request_headers():
+    return {"anthropic-beta": PROMPT_CACHING_BETA} if client_settings["prompt_cache"] else {}
+
+# Add a response's token usage (SDK object or batch result dict) to the run totals;
+# `batch` marks Message Batches results, which are priced at a discount
+def record_usage(usage, batch=False):
+    with _usage_lock:
+        for key in usage_stats:
+            value = usage.get(key) if isinstance(usage, dict) else getattr(usage, key, None)
+            usage_stats[key] += value or 0
+    report.add_usage(usage, batch)
+
+def usage_summary():
+    with _usage_lock:
+        stats = dict(usage_stats)
+    prompt_tokens = stats["input_tokens"] + stats["cache_creation_input_tokens"] + stats["cache_read_input_tokens"]
+    hit_rate = stats["cache_read_input_tokens"] / prompt_tokens if prompt_tokens else 0.0
+    return (f"Tokens: {prompt_tokens} input ({stats['cache_read_input_tokens']} read from prompt cache, "
+            f"{stats['cache_creation_input_tokens']} written to it, {stats['input_tokens']} uncached; "
+            f"{hit_rate:.0%} hit rate), {stats['output_tokens']} output")
+
+# Response cache key of a request for `document` (a job id). Cached responses are complete, continued
+# past any max_tokens cut-off, so the key uses the default budget whatever budget the request was sent with
+def response_cache_key(prompt, system=None, document=None):
+    return ResponseCache.key(MODEL, DEFAULT_MAX_TOKENS, prompt, system, document)
+
+def user_messages(prompt):
+    return prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}]
+
+# Generate synthetic data using Claude API. `kind` is the (platform, doc_type) the response is for;
+# its learned budget is used unless max_tokens is given. `document` is the job id the response is cached under
+def generate_with_claude(prompt, max_tokens=None, system=None, kind=None, document=None):
     """Generate content using Claude API"""
-    api_key = os.getenv("ANTHROPIC_API_KEY")
+    cache_key = None
+    if response_cache is not None:
+        cache_key = response_cache_key(prompt, system, document)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
     
-    if not api_key:
+    if not has_api_key():
         print("ANTHROPIC_API_KEY not found in environment variables.")
         print("Using placeholder response for demo purposes.")
-        return f"[PLACEHOLDER] Synthetic data would be generated based on the prompt."
+        return PLACEHOLDER_RESPONSE
     
-    try:
-        client = anthropic.Anthropic(api_key=api_key)
-        
+    messages = user_messages(prompt)
+    text, stop_reason, output_tokens = create_message(messages, system, max_tokens or token_budgets.max_tokens(kind))
+    text, complete = complete_response(messages, system, text, stop_reason, output_tokens, kind)
+    # A response still cut off would be replayed as if it were whole
+    if cache_key is not None and complete:
+        response_cache.put(cache_key, text)
+    return text
+
+# Send one request; returns (text, stop reason, output tokens)
+def create_message(messages, system, max_tokens):
+    def send(client):
         message = client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=max_tokens,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+            **message_params(messages, system, max_tokens),
+            extra_headers=request_headers(),
         )
-        
-        return message.content[0].text
-    except Exception as e:
-        print(f"Error calling Claude API: {e}")
-        # Fallback to placeholder for demo purposes
-        return f"[API ERROR] Synthetic data would be generated based on the prompt. Error: {str(e)}"
-
-# Clean up LLM-generated content to remove explanatory text
-def clean_llm_content(content, format_type):
-    # Clean up JSON content
-    if format_type == ".json":
-        # Try to find and extract just the JSON part
-        json_pattern = r'```(?:json)?(.*?)```'
-        json_matches = re.findall(json_pattern, content, re.DOTALL)
-        
-        if json_matches:
-            # Take the first JSON match
-            return json_matches[0].strip()
-        
-        # If no JSON block with backticks, try to find content between curly braces
-        if content.count('{') >= 1 and content.count('}') >= 1:
-            start_idx = content.find('{')
-            # Find the last closing brace
-            end_idx = content.rfind('}') + 1
-            if start_idx < end_idx:
-                return content[start_idx:end_idx]
-    
-    # Clean up Markdown content
-    elif format_type == ".md":
-        # Remove any markdown code block indicators
-        content = re.sub(r'```markdown|```md|```', '', content)
-        # Remove explanatory text at the beginning
-        content = re.sub(r'^Here\'s a (?:realistic|sample) .*?:\s*', '', content, flags=re.IGNORECASE | re.DOTALL)
-    
-    # Clean up text content
-    elif format_type == ".txt":
-        # Remove explanatory text at the beginning
-        content = re.sub(r'^Here\'s a (?:simulated|sample) .*?:\s*', '', content, flags=re.IGNORECASE | re.DOTALL)
-    
-    # General cleanup for all formats
-    # Remove "Here's a realistic/sample..." phrases
-    content = re.sub(r'^Here\'s a (?:realistic|sample) .*?:\s*', '', content, flags=re.IGNORECASE)
-    # Remove trailing "This JSON/document provides..." explanations
-    content = re.sub(r'\nThis (?:JSON|document|content) provides.*$', '', content, flags=re.IGNORECASE | re.DOTALL)
-    
-    return content.strip()
-
-# Extract relevant sections from company profile
-def extract_relevant_profile_info(company_profile, section_name=None):
-    sections = {
-        "overview": company_profile.split("**Overview**")[1].split("**Users**")[0].strip(),
-        "users": company_profile.split("**Users**")[1].split("**Competitors**")[0].strip(),
-        "competitors": company_profile.split("**Competitors**")[1].split("**Services/Products**")[0].strip(),
-        "services": company_profile.split("**Services/Products**")[1].split("**Service Cost Structure**")[0].strip(),
-        "costs": company_profile.split("**Service Cost Structure**")[1].split("**User Feedback on SonderMind: Direct Quotes**")[0].strip(),
-        "feedback": company_profile.split("**User Feedback on SonderMind: Direct Quotes**")[1].split("**Outreach and Onboarding**")[0].strip(),
-        "outreach": company_profile.split("**Outreach and Onboarding**")[1].strip()
-    }
+        text = message.content[0].text if message.content else ""
+        return (text, message.stop_reason, message.usage.output_tokens), message.usage
     
-    if section_name and section_name in sections:
-        return sections[section_name]
-    return sections
+    return call_with_retries(send, request_text(messages, system), max_tokens)
 
-# Generate Coda documents
-def generate_coda_files(file_types, themes, company_profile, count=None):
-    coda_types = file_types["sondermind_platforms"]["Coda"]
-    profile_sections = extract_relevant_profile_info(company_profile)
+# Finish a response that stopped at max_tokens by sending it back as the start of the assistant's
+# turn, which the model continues, instead of generating the document again from scratch.
+# Records the response's total output length for its type's token budget.
+# Returns the text and whether it is complete, i.e. no longer cut off at max_tokens
+def complete_response(messages, system, text, stop_reason, output_tokens, kind=None):
+    continuations = 0
+    while stop_reason == "max_tokens" and continuations < client_settings["max_continuations"]:
+        continuations += 1
+        # The API rejects a final assistant turn that ends in whitespace
+        text = text.rstrip()
+        more, stop_reason, more_tokens = create_message(
+            messages + [{"role": "assistant", "content": text}], system, MAX_OUTPUT_TOKENS)
+        text += more
+        output_tokens += more_tokens
     
-    # If count is specified, randomly select that many file types
-    if count and count < len(coda_types):
-        coda_types = random.sample(coda_types, count)
+    if stop_reason == "max_tokens":
+        label = f" for {kind[0]} {kind[1]}" if kind else ""
+        print(f"Response{label} still cut off at max_tokens after {continuations} continuation(s)")
+    complete = stop_reason != "max_tokens"
+    token_budgets.observe(kind, output_tokens, continuations, complete)
+    return text, complete
+
+# Stream a response straight into `filename`; returns (seconds to first token, bytes written).
+# A response cut off at max_tokens is continued and the file rewritten with the whole document
+def stream_with_claude(prompt, filename, format_type, max_tokens=None, system=None, kind=None, document=None):
+    from streaming import stream_to_file
     
-    for file_type in coda_types:
-        # Select 0-4 themes with preference for relevant ones
-        doc_type = file_type["type"]
-        format_type = file_type["format"]
-        
-        # Define themes more likely to be relevant for this document type
-        relevant_theme_keywords = []
-        if "Requirements" in doc_type or "Feature" in doc_type:
-            relevant_theme_keywords = ["Feature Requests", "UI", "UX", "Usability", "Pain Points"]
-        elif "Feedback" in doc_type:
-            relevant_theme_keywords = ["Pain Points", "Objections", "Customer Testimonials", "Usability"]
-        elif "Matching" in doc_type or "Intake" in doc_type:
-            relevant_theme_keywords = ["Matching Efficiency", "Operational Efficiency", "Engagement", "Platform Stability"]
-        elif "Tracking" in doc_type:
-            relevant_theme_keywords = ["Operational Efficiency", "Competitive", "Engagement"]
-        
-        # Filter themes based on relevance (if relevant keywords defined)
-        filtered_themes = []
-        if relevant_theme_keywords:
-            for theme in themes:
-                for keyword in relevant_theme_keywords:
-                    if keyword in theme['Theme Category'] or keyword in theme['Sub-theme']:
-                        filtered_themes.append(theme)
-                        break
-        
-        # If no themes match or no relevant keywords defined, use all themes
-        if not filtered_themes:
-            filtered_themes = themes
-        
-        # Randomly decide how many themes to use (0-4)
-        num_themes = random.randint(0, 4)
-        
-        # If num_themes is 0, we'll have an empty list of selected_themes
-        selected_themes = random.sample(filtered_themes, min(num_themes, len(filtered_themes))) if num_themes > 0 else []
-        
-        # Select relevant sections based on document type
-        relevant_sections = []
-        if "Onboarding" in doc_type:
-            relevant_sections = ["overview", "outreach"]
-        elif "Match" in doc_type:
-            relevant_sections = ["users", "outreach"]
-        elif "Roadmap" in doc_type:
-            relevant_sections = ["services", "competitors"]
-        elif "Billing" in doc_type:
-            relevant_sections = ["costs"]
-        elif "Feedback" in doc_type:
-            relevant_sections = ["feedback"]
-        
-        # Create specific content for prompt based on document type
-        specific_content = ""
-        for section in relevant_sections:
-            if section in profile_sections:
-                specific_content += f"\n--- Relevant Info: {section.upper()} ---\n"
-                specific_content += profile_sections[section][:500]  # Truncate to keep prompt reasonable
-                specific_content += "\n"
-        
-        # Create prompt for Claude with natural theme integration instructions
-        prompt = f"""
-        Generate a realistic {doc_type} for SonderMind in Markdown format. 
-        
-        About SonderMind:
-        SonderMind is a technology-driven behavioral health company that connects individuals with licensed therapists and psychiatrists. 
-        They offer both virtual and in-person therapy services with a focus on personalized care. 
-        
-        {specific_content}
-        
-        This document should be formatted as a realistic Coda document.
-        """
-        
-        if selected_themes:
-            prompt += f"""
-            As you create this document, naturally incorporate the following {len(selected_themes)} themes without explicitly labeling them as themes. The content should naturally address these concepts in a way that feels organic to the document:
-            """
-            
-            for theme in selected_themes:
-                theme_category = theme['Theme Category']
-                subtheme = theme['Sub-theme']
-                
-                prompt += f"\n- {theme_category}: {subtheme}\n"
-                
-                # Add specific guidance related to the theme
-                if "Pain Points" in subtheme:
-                    prompt += "  Naturally include information about challenges therapists face and objections they raise.\n"
-                elif "Feature Requests" in subtheme:
-                    prompt += "  Incorporate details about features users are requesting and their prioritization.\n"
-                elif "Upsell" in subtheme:
-                    prompt += "  Include relevant information about premium services and renewal opportunities.\n"
-                elif "UX/UI Issues" in subtheme:
-                    prompt += "  Address interface problems and improvement recommendations where relevant.\n"
-                elif "Competitive" in subtheme:
-                    prompt += "  Weave in competitor analysis where it makes sense in the document.\n"
-        
-        prompt += """
-        Please make the content highly specific to SonderMind's business model, using realistic metrics, dates, and terminology.
-        Include relevant tables, bullet points, and structured data as would be found in a real document.
-        
-        IMPORTANT:
-        - The document should feel like a cohesive, realistic business document, not a collection of themes
-        - Don't use section headings that directly reference the themes unless it would naturally occur in this type of document
-        - Don't label or call out the themes explicitly - they should be naturally woven into the content
-        - The document's organization and structure should follow standard practices for this document type
-        
-        IMPORTANT: Do not include any explanatory text like "Here's a realistic document" or "This document provides..." 
-        Just give me the document content directly.
-        """
-        
-        print(f"Generating {doc_type}...")
-        # Generate content with Claude
-        content = generate_with_claude(prompt)
+    messages = user_messages(prompt)
+    max_tokens = max_tokens or token_budgets.max_tokens(kind)
+    
+    def send(client):
+        # Entering the stream sends the request, so time to first token counts connect and request latency
+        start = time.perf_counter()
+        with client.messages.stream(
+            **message_params(messages, system, max_tokens),
+            extra_headers=request_headers(),
+        ) as stream:
+            # The raw text is kept for the cache and for continuing a truncated response
+            collected = []
+            def chunks():
+                for text in stream.text_stream:
+                    collected.append(text)
+                    yield text
+            ttft, size = stream_to_file(chunks(), filename, format_type, start)
+            message = stream.get_final_message()
+        return ("".join(collected), message.stop_reason, message.usage.output_tokens, ttft, size), message.usage
+    
+    text, stop_reason, output_tokens, ttft, size = call_with_retries(send, request_text(messages, system), max_tokens)
+    complete = True
+    if stop_reason == "max_tokens":
+        text, complete = complete_response(messages, system, text, stop_reason, output_tokens, kind)
+        size = write_file(filename, clean_content(text, format_type))
+    else:
+        token_budgets.observe(kind, output_tokens)
+    if response_cache is not None and complete:
+        response_cache.put(response_cache_key(prompt, system, document), text)
+    return ttft, size
+
+# Whether an API key is set, in the environment or the .env file; an empty string records that none is
+def has_api_key():
+    with _client_lock:
+        if client_settings["api_key"] is None:
+            load_environment()
+            client_settings["api_key"] = os.getenv("ANTHROPIC_API_KEY") or ""
+    return bool(client_settings["api_key"])
+
+# Run one API request under the rate limiter, retrying throttled or failed attempts.
+# `send(client)` performs the request and returns (result, usage).
+def call_with_retries(send, prompt, max_tokens):
+    client = get_client()
+    # Rough pre-call estimate (~4 characters per token); corrected from usage afterwards
+    estimated_tokens = len(prompt) // 4 + max_tokens
+    max_retries = client_settings["max_retries"]
+    
+    for attempt in range(max_retries + 1):
+        with report.stage("rate_limit"):
+            rate_limiter.acquire(estimated_tokens)
+        try:
+            with report.stage("api"):
+                result, usage = send(client)
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None or attempt == max_retries:
+                print(f"Error calling Claude API: {e}")
+                raise
+            status_code = getattr(e, "status_code", None)
+            print(f"Claude API call failed ({status_code or type(e).__name__}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{max_retries})")
+            report.add_retry()
+            rate_limiter.backoff(delay, rate_limited=status_code in (429, 529))
+            continue
         
-        # Clean up the content
-        content = clean_llm_content(content, format_type)
+        rate_limiter.settle(estimated_tokens, usage.input_tokens + usage.output_tokens)
+        record_usage(usage)
+        return result
+
+# Seconds to wait before retrying a failed call, or None if it should not be retried
+def retry_delay(error, attempt):
+    import anthropic
+    
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code not in RETRYABLE_STATUS_CODES:
+            return None
+        retry_after = parse_retry_after(error.response.headers)
+        if retry_after is not None:
+            return retry_after
+    elif not isinstance(error, anthropic.APIConnectionError):
+        return None
+    return backoff_delay(attempt)
+
+# Check a cleaned JSON document against its schema, asking the model to fix it if needed.
+# Returns the valid content; raises ValueError if it is still invalid after the allowed repairs.
+def validate_json_output(job, content):
+    schema = load_schema(job["schema_name"])
+    for attempt in range(validation_settings["repairs"] + 1):
+        start = time.perf_counter()
+        errors = check_document(content, schema)
+        with _validation_lock:
+            validation_stats["checks"] += 1
+            validation_stats["seconds"] += time.perf_counter() - start
+            if attempt == 0:
+                validation_stats["documents"] += 1
+                if errors:
+                    validation_stats["invalid"] += 1
+            elif not errors:
+                validation_stats["repaired"] += 1
         
-        # Save to file
-        filename = f"output/Coda/{doc_type.replace(' ', '_').lower()}{format_type}"
-        with open(filename, 'w') as f:
-            f.write(content)
+        if not errors:
+            return content
+        # Repairs need the original request, which resumed batch jobs no longer carry
+        if attempt == validation_settings["repairs"] or "prompt" not in job or not has_api_key():
+            break
         
-        print(f"Generated: {filename}")
-
-# Generate Dialpad data
-def generate_dialpad_files(file_types, themes, company_profile, count=None):
-    dialpad_types = file_types["sondermind_platforms"]["Dialpad"]
-    profile_sections = extract_relevant_profile_info(company_profile)
+        print(f"{job['id']} does not match its schema ({errors[0]}), requesting a repair")
+        repair_request = ("The JSON above does not match the required structure:\n"
+                          + "\n".join(f"- {error}" for error in errors)
+                          + "\n\nReturn the complete corrected JSON only, with no explanatory text.")
+        messages = [
+            {"role": "user", "content": job["prompt"]},
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": repair_request},
+        ]
+        content = clean_content(generate_with_claude(messages, system=job["system"],
+                                                     kind=(job["platform"], job["doc_type"]), document=job["id"]),
+                                job["format"])
     
+    with _validation_lock:
+        validation_stats["failed"] += 1
+    raise ValueError(f"{job['schema_name']} schema check failed: {errors[0]}")
+
+def validation_summary():
+    with _validation_lock:
+        stats = dict(validation_stats)
+    invalid_rate = stats["invalid"] / stats["documents"] if stats["documents"] else 0.0
+    rate = stats["checks"] / stats["seconds"] if stats["seconds"] else 0.0
+    return (f"JSON validation: {stats['documents']} documents, {stats['checks']} checks in {stats['seconds']:.3f}s "
+            f"({rate:.0f} checks/s); {stats['invalid']} invalid ({invalid_rate:.1%}), "
+            f"{stats['repaired']} repaired, {stats['failed']} still invalid")
+
+# 32-bit seed for one named part of a run, derived from the run seed
+def derive_seed(run_seed, *parts):
+    digest = hashlib.sha256(json.dumps([run_seed, *parts]).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big")
+
+# Build generation jobs for one platform from its registry specs
+def build_platform_jobs(type_specs, count=None, per_type=1, run_seed=0):
     # If count is specified, randomly select that many file types
-    if count and count < len(dialpad_types):
-        dialpad_types = random.sample(dialpad_types, count)
+    if count and count < len(type_specs):
+        spec = type_specs[0]
+        rng = random.Random(derive_seed(run_seed, spec["company_slug"], spec["platform"], "types"))
+        type_specs = rng.sample(type_specs, count)
     
-    for file_type in dialpad_types:
-        # Select 0-4 themes with preference for relevant ones
-        doc_type = file_type["type"]
-        format_type = file_type["format"]
-        
-        # Define themes more likely to be relevant for this document type
-        relevant_theme_keywords = []
-        if "Call Logs" in doc_type or "Outreach" in doc_type:
-            relevant_theme_keywords = ["Sales", "Pain Points", "Objections", "Competitive"]
-        elif "Objection" in doc_type:
-            relevant_theme_keywords = ["Pain Points", "Objections", "Competitive", "Value Proposition"]
-        elif "Support" in doc_type:
-            relevant_theme_keywords = ["Support Ticket", "Usability", "Feature Requests"]
-        elif "Quality" in doc_type:
-            relevant_theme_keywords = ["Value Proposition", "Usability", "Operational Efficiency"]
-        
-        # Filter themes based on relevance
-        filtered_themes = []
-        if relevant_theme_keywords:
-            for theme in themes:
-                for keyword in relevant_theme_keywords:
-                    if keyword in theme['Theme Category'] or keyword in theme['Sub-theme']:
-                        filtered_themes.append(theme)
-                        break
-        
-        # If no themes match or no relevant keywords defined, use all themes
-        if not filtered_themes:
-            filtered_themes = themes
-        
-        # Randomly decide how many themes to use (0-4)
-        num_themes = random.randint(0, 4)
-        
-        # If num_themes is 0, we'll have an empty list of selected_themes
-        selected_themes = random.sample(filtered_themes, min(num_themes, len(filtered_themes))) if num_themes > 0 else []
-        
-        # Select relevant sections based on document type
-        relevant_sections = []
-        if "Call Logs" in doc_type:
-            relevant_sections = ["users", "feedback"]
-        elif "Conversation" in doc_type:
-            relevant_sections = ["feedback", "users"]
-        elif "Support" in doc_type:
-            relevant_sections = ["feedback", "services"]
-        elif "Quality" in doc_type:
-            relevant_sections = ["outreach", "feedback"]
-        elif "Outreach" in doc_type:
-            relevant_sections = ["outreach", "users"]
-        
-        # Create specific content for prompt
-        specific_content = ""
-        for section in relevant_sections:
-            if section in profile_sections:
-                specific_content += f"\n--- Relevant Info: {section.upper()} ---\n"
-                specific_content += profile_sections[section][:500]  # Truncate to keep prompt reasonable
-                specific_content += "\n"
-        
-        # Create prompt for Claude with exact Dialpad JSON structure
-        prompt = f"""
-        Generate a realistic {doc_type} for SonderMind in JSON format.
-        
-        About SonderMind:
-        SonderMind is a technology-driven behavioral health company that connects individuals with licensed therapists and psychiatrists. 
-        They offer both virtual and in-person therapy services with a focus on personalized care.
-        
-        {specific_content}
-        
-        This document should be formatted as a realistic Dialpad JSON export with the following EXACT structure:
+    # Model settings are the same for every job
+    model_digest = digest(MODEL, DEFAULT_MAX_TOKENS)
+    jobs = []
+    for spec in type_specs:
+        company_slug = spec["company_slug"]
+        platform = spec["platform"]
+        doc_type = spec["doc_type"]
+        format_type = spec["format"]
         
-        {{
-          "call_id": "unique ID string",
-          "lines": [
-            {{
-              "contact_id": "contact ID string",
-              "content": "Message content",
-              "name": "Speaker name",
-              "time": "ISO timestamp format (YYYY-MM-DDThh:mm:ss.ssssss)",
-              "type": "transcript"
-            }},
-            {{
-              "content": "action_item or other moment type",
-              "name": "Speaker name",
-              "time": "ISO timestamp format (YYYY-MM-DDThh:mm:ss.ssssss)",
-              "type": "moment",
-              "user_id": "user ID string"
-            }}
-            // And so on with more lines...
-          ]
-        }}
-        
-        IMPORTANT REQUIREMENTS:
-        1. Each line in the "lines" array must be either:
-           - "type": "transcript" (for spoken dialog)
-           - "type": "moment" (for system events, action items, etc.)
-        2. "transcript" type lines should have: contact_id, content, name, time, type
-        3. "moment" type lines should have: content, name, time, type, user_id
-        4. "time" values should be valid ISO timestamps in YYYY-MM-DDThh:mm:ss.ssssss format
-        5. Caller/therapist exchanges should be realistic for a SonderMind conversation
-        """
-        
-        if selected_themes:
-            prompt += f"""
-            As you create this JSON document, naturally incorporate the following {len(selected_themes)} themes without explicitly labeling them. The data should naturally include information relevant to these concepts:
-            """
+        for index in range(per_type):
+            # Each document samples its themes from an RNG seeded by the run seed and its id,
+            # so a document's themes do not depend on which other documents are planned
+            job_id = document_id(company_slug, platform, doc_type, index)
+            seed = derive_seed(run_seed, job_id)
+            rng = random.Random(seed)
             
-            for theme in selected_themes:
-                theme_category = theme['Theme Category']
-                subtheme = theme['Sub-theme']
-                
-                prompt += f"\n- {theme_category}: {subtheme}\n"
-                
-                # Add specific guidance related to the theme
-                if "Pain Points" in subtheme:
-                    prompt += "  Include data about challenges therapists face in conversation content and summary fields.\n"
-                elif "Feature Requests" in subtheme:
-                    prompt += "  Incorporate feature request mentions and indicators in the data where relevant.\n"
-                elif "Upsell" in subtheme:
-                    prompt += "  Include data relating to renewal and premium service opportunities where appropriate.\n"
-                elif "UX/UI Issues" in subtheme:
-                    prompt += "  Incorporate interface issues in conversation content where natural.\n"
-                elif "Competitive" in subtheme:
-                    prompt += "  Include competitor mentions where they would naturally occur in conversations or data.\n"
-        
-        prompt += """
-        Please make the content highly specific to SonderMind's business model, using realistic dialog, dates, and context.
-        
-        IMPORTANT:
-        - FOLLOW THE EXACT JSON STRUCTURE DEFINED ABOVE
-        - The conversation should flow naturally between SonderMind representatives and therapists/clients
-        - Create a realistic mix of transcript and moment types throughout
-        - Ensure the themes are incorporated naturally in conversation content, not as artificial fields
-        - Do not add any additional fields to the JSON structure
-        - Make sure all JSON is properly formatted and valid
-        
-        IMPORTANT: Do not include any explanatory text like "Here's a realistic document" or "This JSON provides..." 
-        Just give me the JSON content directly.
-        """
-        
-        print(f"Generating {doc_type}...")
-        # Generate content with Claude
-        content = generate_with_claude(prompt)
-        
-        # Clean up the content
-        content = clean_llm_content(content, format_type)
-        
-        # Save to file
-        filename = f"output/Dialpad/{doc_type.replace(' ', '_').lower()}{format_type}"
-        with open(filename, 'w') as f:
-            f.write(content)
-        
-        print(f"Generated: {filename}")
+            # Select 0-4 themes from those relevant to this document type, by weight
+            num_themes = rng.randint(0, 4)
+            selected_themes = spec["themes"].sample(rng, num_themes)
+            
+            start = time.perf_counter()
+            prompt = render_prompt(spec, selected_themes)
+            report.record("prompt", time.perf_counter() - start, (platform, doc_type))
+            
+            themes = [{"category": theme['Theme Category'], "subtheme": theme['Sub-theme']} for theme in selected_themes]
+            inputs = {**spec["inputs"], "themes": digest(themes), "model": model_digest}
+            
+            jobs.append({
+                "id": job_id,
+                "company": spec["company"],
+                "platform": platform,
+                "doc_type": doc_type,
+                "format": format_type,
+                "index": index,
+                "seed": seed,
+                "run_seed": run_seed,
+                "themes": themes,
+                "sections": spec["sections"],
+                "template": spec["template_name"],
+                "inputs": inputs,
+                "fingerprint": fingerprint(inputs),
+                "system": spec["system"],
+                "schema_name": spec["schema_name"],
+                "prompt": prompt,
+                "output": spec["output"],
+                "filename": document_filename(platform, doc_type, format_type, index, spec["output"]),
+            })
+    
+    return jobs
 
-# Generate Slack data
-def generate_slack_files(file_types, themes, company_profile, count=None):
-    slack_types = file_types["sondermind_platforms"]["Slack"]
-    profile_sections = extract_relevant_profile_info(company_profile)
+# Build one company's jobs, honouring --per-type/--total and its quota
+def build_company_jobs(company, registry, platforms, args):
+    limit = args.total
+    if company["quota"] is not None:
+        limit = min(limit, company["quota"]) if limit else company["quota"]
     
-    # If count is specified, randomly select that many file types
-    if count and count < len(slack_types):
-        slack_types = random.sample(slack_types, count)
+    # With a total or quota, build enough documents per type to cover it
+    per_type = args.per_type
+    if limit:
+        type_count = count_file_types(registry, platforms, args.count)
+        if type_count:
+            per_type = -(-limit // type_count)
     
-    for file_type in slack_types:
-        # Select 0-4 themes with preference for relevant ones
-        doc_type = file_type["type"]
-        format_type = file_type["format"]
-        
-        # Define themes more likely to be relevant for this document type
-        relevant_theme_keywords = []
-        if "Onboarding" in doc_type:
-            relevant_theme_keywords = ["Engagement", "Drop-off", "Operational Efficiency"]
-        elif "Matching" in doc_type:
-            relevant_theme_keywords = ["Matching", "Efficiency", "Platform Stability"]
-        elif "Billing" in doc_type:
-            relevant_theme_keywords = ["Pain Points", "Objections", "Support Ticket"]
-        elif "Support" in doc_type or "Incident" in doc_type:
-            relevant_theme_keywords = ["Platform Stability", "Downtime", "Support Ticket", "UX/UI Issues"]
-        elif "Release" in doc_type:
-            relevant_theme_keywords = ["Feature Requests", "Competitive", "Usability"]
-        
-        # Filter themes based on relevance
-        filtered_themes = []
-        if relevant_theme_keywords:
-            for theme in themes:
-                for keyword in relevant_theme_keywords:
-                    if keyword in theme['Theme Category'] or keyword in theme['Sub-theme']:
-                        filtered_themes.append(theme)
-                        break
-        
-        # If no themes match or no relevant keywords defined, use all themes
-        if not filtered_themes:
-            filtered_themes = themes
-        
-        # Randomly decide how many themes to use (0-4)
-        num_themes = random.randint(0, 4)
-        
-        # If num_themes is 0, we'll have an empty list of selected_themes
-        selected_themes = random.sample(filtered_themes, min(num_themes, len(filtered_themes))) if num_themes > 0 else []
-        
-        # Select relevant sections based on document type
-        relevant_sections = []
-        if "Onboarding" in doc_type:
-            relevant_sections = ["outreach", "users"]
-        elif "Matching" in doc_type:
-            relevant_sections = ["users", "services"]
-        elif "Billing" in doc_type:
-            relevant_sections = ["costs", "feedback"]
-        elif "Support" in doc_type:
-            relevant_sections = ["feedback", "services"]
-        elif "Release" in doc_type:
-            relevant_sections = ["services", "competitors"]
-        
-        # Create specific content for prompt
-        specific_content = ""
-        for section in relevant_sections:
-            if section in profile_sections:
-                specific_content += f"\n--- Relevant Info: {section.upper()} ---\n"
-                specific_content += profile_sections[section][:500]  # Truncate to keep prompt reasonable
-                specific_content += "\n"
-        
-        # Create prompt for Claude with natural theme incorporation
-        prompt = f"""
-        Generate a realistic {doc_type} for SonderMind.
-        
-        About SonderMind:
-        SonderMind is a technology-driven behavioral health company that connects individuals with licensed therapists and psychiatrists. 
-        They offer both virtual and in-person therapy services with a focus on personalized care.
-        
-        {specific_content}
+    jobs = []
+    for platform in platforms:
+        jobs.extend(build_platform_jobs(registry[platform], args.count, per_type, args.seed))
+    
+    # Take documents round-robin across types so the limit is spread evenly
+    if limit:
+        jobs = sorted(jobs, key=lambda job: job["index"])[:limit]
+    return jobs
+
+# Plan every company's jobs, interleaved into one queue and numbered, then cut to --job-range
+def build_plan(tenants, args):
+    job_lists = []
+    for company, registry, platforms in tenants:
+        job_lists.append(build_company_jobs(company, registry, platforms, args))
+    jobs = interleave(job_lists)
+    for seq, job in enumerate(jobs):
+        job["seq"] = seq
+    
+    start, end = args.job_range or (0, None)
+    return jobs[start:end]
+
+# Write the plan as JSONL, leaving out the prompts
+def write_plan(jobs, path):
+    writer = ManifestWriter(path)
+    try:
+        for job in jobs:
+            writer.write({key: value for key, value in job.items() if key not in ("prompt", "system")})
+    finally:
+        writer.close()
+
+# Run a single generation job and write its output file
+def run_job(job, stream=False):
+    with report.job(job["platform"], job["doc_type"]):
+        print(f"Generating {job['doc_type']}...")
+        start = time.perf_counter()
         
-        This document should be formatted as realistic Slack messages or notifications.
-        """
+        cached = None
+        if stream and response_cache is not None:
+            cached = response_cache.get(response_cache_key(job["prompt"], job["system"], job["id"]))
         
-        if selected_themes:
-            prompt += f"""
-            As you create these Slack messages, naturally incorporate the following {len(selected_themes)} themes without explicitly labeling them. The conversation should naturally touch on these topics:
-            """
+        if stream and cached is None and has_api_key():
+            # Write chunks to disk as they arrive
+            ttft, size = stream_with_claude(job["prompt"], job["filename"], job["format"], system=job["system"],
+                                            kind=(job["platform"], job["doc_type"]), document=job["id"])
+            duplicate = {}
+            if job["schema_name"] or dedup_index is not None:
+                # Check the streamed file; a repaired or regenerated document replaces it
+                with open(job["filename"], 'r') as f:
+                    content = f.read()
+                kept = content
+                try:
+                    if job["schema_name"]:
+                        with report.stage("validate"):
+                            kept = validate_json_output(job, kept)
+                    if dedup_index is not None:
+                        kept, duplicate = deduplicate(job, kept)
+                except ValueError:
+                    # A rejected document must not be left behind for the next run to mistake as done
+                    os.remove(job["filename"])
+                    raise
+                if kept is not content:
+                    size = write_file(job["filename"], kept)
+            record_job_output(job, size, {"ttft": round(ttft, 4) if ttft is not None else None,
+                                          "latency": round(time.perf_counter() - start, 4), **duplicate})
+        else:
+            # Generate content with Claude
+            content = cached if cached is not None else generate_with_claude(
+                job["prompt"], system=job["system"], kind=(job["platform"], job["doc_type"]), document=job["id"])
             
-            for theme in selected_themes:
-                theme_category = theme['Theme Category']
-                subtheme = theme['Sub-theme']
-                
-                prompt += f"\n- {theme_category}: {subtheme}\n"
-                
-                # Add specific guidance related to the theme
-                if "Pain Points" in subtheme:
-                    prompt += "  Include messages that discuss challenges therapists face in a natural way.\n"
-                elif "Feature Requests" in subtheme:
-                    prompt += "  Include mentions of feature requests and prioritization in the conversation.\n"
-                elif "Upsell" in subtheme:
-                    prompt += "  Incorporate discussion of premium services or renewals where it fits naturally.\n"
-                elif "UX/UI Issues" in subtheme:
-                    prompt += "  Include messages about interface issues where they would naturally come up.\n"
-                elif "Competitive" in subtheme:
-                    prompt += "  Incorporate messages mentioning competitors where relevant to the conversation.\n"
+            # Clean up the content and save to file
+            write_job_output(job, content, {"latency": round(time.perf_counter() - start, 4)})
         
-        # Format the output structure based on the format type
-        if format_type == ".json":
-            prompt += """
-            Please format the output as a JSON array of slack messages with the following structure:
-            
-            [
-              {
-                "user": "User's name or bot name",
-                "timestamp": "ISO timestamp",
-                "text": "Message content",
-                "channel": "Channel name",
-                "reactions": [
-                  {
-                    "name": "reaction emoji name",
-                    "count": number of reactions,
-                    "users": ["user1", "user2"]
-                  }
-                ],
-                "thread_ts": "thread timestamp if part of a thread",
-                "replies": [
-                  {
-                    "user": "Replying user name",
-                    "timestamp": "ISO timestamp",
-                    "text": "Reply content"
-                  }
-                ]
-              }
-            ]
-            
-            IMPORTANT:
-            - The conversation should feel natural and authentic, not contrived around themes
-            - Don't explicitly label or flag themes in the messages
-            - The selected themes should emerge organically through the conversation topics
-            - The message structure should follow realistic Slack conversation patterns
-            
-            IMPORTANT: Do not include any explanatory text like "Here's a realistic document" or "This JSON provides..." 
-            Just give me the JSON content directly.
-            """
+        print(f"Generated: {job['filename']}")
+        return job["filename"]
+
+# Run every job on a bounded worker pool so API round-trips overlap
+def run_jobs(jobs, concurrency=DEFAULT_CONCURRENCY, stream=False):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    
+    failures = []
+    start = time.perf_counter()
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(run_job, job, stream): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error generating {job['platform']} {job['doc_type']}: {e}")
+                failures.append(job)
+                if journal is not None:
+                    journal.mark(job["id"], "failed", str(e))
+    
+    elapsed = time.perf_counter() - start
+    print(f"\nProcessed {len(jobs)} jobs in {elapsed:.2f}s (concurrency={concurrency})")
+    return failures
+
+# Clean a job's raw output and, for JSON formats, validate it against its schema.
+# Placeholder responses of a run without an API key are written as they are
+def prepare_output(job, content):
+    placeholder = content == PLACEHOLDER_RESPONSE
+    with report.stage("clean"):
+        content = clean_content(content, job["format"])
+    if job.get("schema_name") and not placeholder:
+        with report.stage("validate"):
+            content = validate_json_output(job, content)
+    return content
+
+# Check a finished document against the near-duplicate index and add it. With --dedup regenerate
+# a near-duplicate is requested once more with a note asking for a distinct document.
+# Returns the content to keep and the manifest fields describing any match that remains
+def deduplicate(job, content):
+    with report.stage("dedup"):
+        sig = near_duplicates.signature(content)
+        match = dedup_index.nearest(job["platform"], job["doc_type"], sig, exclude=job["id"])
+    
+    regenerated = False
+    if match and dedup_settings["mode"] == "regenerate" and job.get("prompt"):
+        prompt = job["prompt"] + DIVERSITY_NOTE.format(doc_type=job["doc_type"])
+        content = prepare_output(job, generate_with_claude(prompt, system=job["system"],
+                                                           kind=(job["platform"], job["doc_type"]),
+                                                           document=job["id"]))
+        regenerated = True
+        with report.stage("dedup"):
+            sig = near_duplicates.signature(content)
+            match = dedup_index.nearest(job["platform"], job["doc_type"], sig, exclude=job["id"])
+    
+    with report.stage("dedup"):
+        dedup_index.add(job["id"], job["platform"], job["doc_type"], sig)
+    with _dedup_lock:
+        dedup_stats["documents"] += 1
+        dedup_stats["duplicates"] += 1 if match else 0
+        dedup_stats["regenerated"] += 1 if regenerated else 0
+    if match:
+        return content, {"near_duplicate_of": match[0], "similarity": round(match[1], 3)}
+    return content, {}
+
+def dedup_summary():
+    with _dedup_lock:
+        stats = dict(dedup_stats)
+    return (f"Near-duplicates: {stats['duplicates']} of {stats['documents']} documents flagged "
+            f"({stats['regenerated']} regenerated)")
+
+# Write a job's cleaned (and, for JSON, validated) output file and record it in the manifest
+def write_job_output(job, content, extra=None):
+    placeholder = content == PLACEHOLDER_RESPONSE
+    content = prepare_output(job, content)
+    if dedup_index is not None and not placeholder:
+        content, duplicate = deduplicate(job, content)
+        extra = {**(extra or {}), **duplicate}
+    if placeholder:
+        # Flagged so --incremental generates the document once a run has an API key
+        extra = {**(extra or {}), "placeholder": True}
+    
+    with report.stage("write"):
+        if shard_writers:
+            # Recorded once the document's block is on disk
+            size = len(content.encode("utf-8"))
+            shard_writers[job["output"]].add(
+                job["id"], os.path.relpath(job["filename"], job["output"]), content,
+                metadata={key: job[key] for key in ("company", "platform", "doc_type", "format", "seed", "themes")},
+                on_written=lambda entry: record_job_output(job, size, {**(extra or {}), "shard": entry["shard"]}),
+            )
         else:
-            prompt += """
-            Please format the output as plain text Slack messages with the following structure:
-            
-            [Channel: #channel-name]
-            
-            [User Name] 10:15 AM
-            Message content
-            
-            [Another User] 10:17 AM
-            Reply message
+            record_job_output(job, write_file(job["filename"], content), extra)
+
+# Write `content` to `filename` and return its size in bytes
+def write_file(filename, content):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w') as f:
+        f.write(content)
+    return len(content.encode("utf-8"))
+
+# Record a written document in the manifest and mark it done in the journal
+def record_job_output(job, size, extra=None):
+    if manifest is not None:
+        record = {
+            "id": job["id"],
+            "company": job["company"],
+            "platform": job["platform"],
+            "doc_type": job["doc_type"],
+            "format": job["format"],
+            "index": job["index"],
+            "seed": job["seed"],
+            "themes": job["themes"],
+            "filename": job["filename"],
+            "bytes": size,
+            "model": MODEL,
+            # Jobs resumed from an older batch state file may predate the fields below
+            "run_seed": job.get("run_seed"),
+            "sections": job.get("sections"),
+            "template": job.get("template"),
+            "schema": job.get("schema_name"),
+            "inputs": job.get("inputs"),
+            "fingerprint": job.get("fingerprint"),
+        }
+        if extra:
+            record.update(extra)
+        manifest.write(record)
+    if journal is not None:
+        # Placeholders stay unfinished, so a --resume run with an API key generates them
+        journal.mark(job["id"], "placeholder" if extra and extra.get("placeholder") else "done")
+
+# Submit every job through the Message Batches API, then collect the results
+def run_batch_jobs(jobs, state_path=DEFAULT_BATCH_STATE_PATH, batch_size=MAX_BATCH_REQUESTS,
+                   poll_interval=DEFAULT_POLL_INTERVAL):
+    state = {"batches": []}
+    
+    # Jobs with a cached response never need to be submitted
+    pending = []
+    for job in jobs:
+        cached = None
+        if response_cache is not None:
+            cached = response_cache.get(response_cache_key(job["prompt"], job["system"], job["id"]))
+        if cached is not None:
+            try:
+                with report.job(job["platform"], job["doc_type"]):
+                    write_job_output(job, cached)
+                print(f"Generated (cached): {job['filename']}")
+                continue
+            except ValueError as e:
+                print(f"Cached response for {job['id']} rejected ({e}), submitting it again")
+        pending.append(job)
+    
+    client = BatchClient(client_settings["api_key"], client_settings["base_url"], extra_headers=request_headers())
+    live_jobs = {}
+    try:
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            requests = []
+            batch_jobs = {}
+            for offset, job in enumerate(chunk):
+                custom_id = f"job-{start + offset}"
+                requests.append({
+                    "custom_id": custom_id,
+                    "params": message_params(job["prompt"], job["system"],
+                                             token_budgets.max_tokens((job["platform"], job["doc_type"]))),
+                })
+                # Prompts stay out of the state file; only this run can repair invalid JSON
+                batch_jobs[custom_id] = {key: value for key, value in job.items() if key not in ("prompt", "system")}
+                live_jobs[custom_id] = job
+                batch_jobs[custom_id]["cache_key"] = response_cache_key(job["prompt"], job["system"], job["id"])
             
-            [Bot Name] 10:20 AM
-            Bot notification or message
+            batch = client.submit(requests)
+            state["batches"].append({"id": batch["id"], "status": "submitted", "jobs": batch_jobs})
+            # Persist the mapping before polling so an interrupted run can resume
+            save_batch_state(state_path, state)
+            print(f"Submitted batch {batch['id']} with {len(requests)} requests")
+        
+        return collect_batch_results(client, state, state_path, poll_interval, live_jobs)
+    finally:
+        client.close()
+
+# Resume polling batches recorded by an earlier --batch run. The state file leaves out prompts, so
+# they are taken from `planned`, the run's plan rebuilt from its seed: a planned job with the same id
+# and input fingerprint has the same prompt, which truncated results are continued and repaired with
+def resume_batch_jobs(state_path=DEFAULT_BATCH_STATE_PATH, poll_interval=DEFAULT_POLL_INTERVAL, planned=()):
+    state = load_batch_state(state_path)
+    jobs = [job for batch in state["batches"] for job in batch["jobs"].values()]
+    planned = {job["id"]: job for job in planned}
+    live_jobs = {}
+    for batch in state["batches"]:
+        for custom_id, job in batch["jobs"].items():
+            match = planned.get(job["id"])
+            if match is not None and match["fingerprint"] == job.get("fingerprint"):
+                live_jobs[custom_id] = match
+    if len(live_jobs) < len(jobs):
+        print(f"{len(jobs) - len(live_jobs)} of {len(jobs)} batch jobs are not in the replanned run; "
+              "their truncated results cannot be continued")
+    client = BatchClient(client_settings["api_key"], client_settings["base_url"], extra_headers=request_headers())
+    try:
+        return jobs, collect_batch_results(client, state, state_path, poll_interval, live_jobs)
+    finally:
+        client.close()
+
+# Wait for each uncollected batch to end and stream its results to disk
+def collect_batch_results(client, state, state_path, poll_interval, live_jobs=None):
+    failures = []
+    for batch in state["batches"]:
+        if batch["status"] == "collected":
+            continue
+        
+        info = client.wait(batch["id"], poll_interval)
+        for result in client.results(info):
+            job = batch["jobs"].get(result["custom_id"])
+            if job is None:
+                print(f"Batch {batch['id']} returned unknown custom_id {result['custom_id']}")
+                continue
             
-            IMPORTANT:
-            - The conversation should feel natural and authentic, not contrived around themes
-            - Don't explicitly label or flag themes in the messages
-            - The selected themes should emerge organically through the conversation topics
-            - The message structure should follow realistic Slack conversation patterns
+            outcome = result["result"]
+            if outcome["type"] != "succeeded":
+                print(f"Error generating {job['platform']} {job['doc_type']}: batch request {outcome['type']} "
+                      f"{outcome.get('error', '')}")
+                failures.append(job)
+                report.record_failure(job["platform"], job["doc_type"])
+                if journal is not None:
+                    journal.mark(job["id"], "failed", f"batch request {outcome['type']}")
+                continue
             
-            IMPORTANT: Do not include any explanatory text like "Here's a realistic document" or "This data provides..." 
-            Just give me the Slack message content directly.
-            """
+            try:
+                with report.job(job["platform"], job["doc_type"]):
+                    message = outcome["message"]
+                    text = message["content"][0]["text"]
+                    usage = message.get("usage", {})
+                    record_usage(usage, batch=True)
+                    live_job = (live_jobs or {}).get(result["custom_id"], job)
+                    kind = (job["platform"], job["doc_type"])
+                    if "prompt" in live_job:
+                        # Truncated results are continued with direct requests
+                        text, complete = complete_response(
+                            user_messages(live_job["prompt"]), live_job["system"], text,
+                            message.get("stop_reason"), usage.get("output_tokens", 0), kind)
+                    else:
+                        # A resumed document missing from the replanned jobs has no prompt to continue from
+                        complete = message.get("stop_reason") != "max_tokens"
+                        token_budgets.observe(kind, usage.get("output_tokens", 0), complete=complete)
+                    if response_cache is not None and complete:
+                        response_cache.put(job["cache_key"], text)
+                    write_job_output(live_job, text)
+            except ValueError as e:
+                print(f"Error generating {job['platform']} {job['doc_type']}: {e}")
+                failures.append(job)
+                if journal is not None:
+                    journal.mark(job["id"], "failed", str(e))
+                continue
+            print(f"Generated: {job['filename']}")
         
-        print(f"Generating {doc_type}...")
-        # Generate content with Claude
-        content = generate_with_claude(prompt)
+        batch["status"] = "collected"
+        save_batch_state(state_path, state)
+    return failures
+
+# Print the run's summaries and write the JSON report to `report_path`
+def print_run_summary(report_path):
+    print(rate_limiter.summary())
+    print(usage_summary())
+    print(validation_summary())
+    print(token_budgets.summary())
+    if dedup_index is not None:
+        print(dedup_summary())
+    if response_cache is not None:
+        print(response_cache.summary())
+    print(report.format_stages())
+    
+    with rate_limiter.lock:
+        rate_limiting = dict(rate_limiter.stats)
+    with _validation_lock:
+        validation = dict(validation_stats)
+    with _dedup_lock:
+        dedup = dict(dedup_stats)
+    report.write(report_path, {"rate_limiting": rate_limiting, "validation": validation, "dedup": dedup,
+                               "token_budgets": token_budgets.snapshot()})
+    summary = report.summary()
+    cost = f", estimated ${summary['cost_usd']:.2f}" if summary["cost_usd"] is not None else ""
+    print(f"{summary['docs']} documents at {summary['docs_per_second'] or 0:.2f} docs/s and "
+          f"{summary['tokens_per_second'] or 0:.0f} tokens/s{cost}; report written to {report_path}")
+
+# Export the labels of every document in the manifest, if --labels asks for them
+def write_labels(args):
+    if not args.labels:
+        return
+    try:
+        count = export_labels(args.manifest, args.labels)
+    except (OSError, RuntimeError) as e:
+        print(f"Error exporting labels: {e}")
+        return
+    print(f"Wrote labels for {count} documents to {args.labels}")
+
+# Seed recorded by the run being resumed: in the shared queue for worker runs, otherwise in the journal
+def resumed_seed(args):
+    store = JobQueue(args.queue) if args.workers or args.enqueue else RunJournal(args.journal)
+    try:
+        return store.run_seed()
+    finally:
+        store.close()
+
+# Command line for a local worker process: this run's arguments minus --workers
+def worker_command(worker_id):
+    argv = []
+    skip_value = False
+    for arg in sys.argv[1:]:
+        if skip_value:
+            skip_value = False
+        elif arg == '--workers':
+            skip_value = True
+        elif not arg.startswith('--workers='):
+            argv.append(arg)
+    return [sys.executable, os.path.abspath(__file__), *argv, '--worker', '--worker-id', worker_id]
+
+# Enqueue the planned jobs, then (unless only enqueuing) run local workers until the queue drains;
+# documents an incremental run carries over (id -> manifest record) are enqueued as already done
+def coordinate(jobs, args, carried=None):
+    import subprocess
+    
+    queue = JobQueue(args.queue)
+    try:
+        queued = queue.enqueue(jobs, reset=not args.resume, done=carried)
+        queue.set_seed(args.seed)
+        if args.dedup != 'off' and not (args.resume or args.incremental):
+            # Workers share one near-duplicate index; a fresh run starts it empty
+            NearDuplicateIndex(args.dedup_index, args.dedup_threshold, reset=True).close()
+        queue.set_budget(args.rpm, args.tpm, args.workers or 1)
+        print(f"Queued {queued} jobs in {args.queue} for {args.workers or 1} worker(s)")
+        if args.enqueue:
+            return 0
         
-        # Clean up the content
-        content = clean_llm_content(content, format_type)
+        workers = [subprocess.Popen(worker_command(f"worker-{i}")) for i in range(args.workers)]
+        exit_codes = [worker.wait() for worker in workers]
         
-        # Save to file
-        filename = f"output/Slack/{doc_type.replace(' ', '_').lower()}{format_type}"
-        with open(filename, 'w') as f:
-            f.write(content)
+        count = queue.export_manifest(args.manifest)
+        counts = queue.counts()
+        print(f"Workers finished: {counts.get('done', 0)} done, {counts.get('placeholder', 0)} placeholders, "
+              f"{counts.get('failed', 0)} failed, {counts.get('pending', 0) + counts.get('leased', 0)} unfinished; "
+              f"{count} records in {args.manifest}")
+        write_labels(args)
+        if any(exit_codes) or set(counts) - {'done', 'placeholder'}:
+            return 1
+        print("\nAll files generated successfully!")
+        return 0
+    finally:
+        queue.close()
+
+# Claim and run jobs from the shared queue until none are left
+def run_worker(args):
+    import socket
+    
+    global manifest, journal, report
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = JobQueue(args.queue, worker=worker_id)
+    
+    # Take this worker's share of the run-wide rate budget unless limits are given explicitly
+    rpm, tpm = queue.worker_budget()
+    configure_client(args.base_url, args.pool_size or args.concurrency, not args.no_prompt_cache)
+    configure_rate_limits(args.rpm or rpm, args.tpm or tpm, args.max_retries)
+    configure_cache(args.cache, args.cache_path, args.cache_max_mb, args.cache_max_age)
+    validation_settings["repairs"] = args.json_repairs
+    configure_dedup(args.dedup, args.dedup_index, args.dedup_threshold)
+    configure_token_budgets(args.token_budgets, args.max_tokens, args.max_continuations)
+    
+    # Finished documents and their manifest records go straight into the queue
+    manifest = journal = queue
+    report = RunReport(MODEL)
+    processed = 0
+    failures = []
+    progress = ProgressLine(report, args.progress).start() if args.progress else None
+    # Keeps the leases of claimed jobs alive however long their generation takes
+    heartbeat = LeaseHeartbeat(queue, args.lease).start()
+    try:
+        while True:
+            jobs = queue.claim(args.concurrency * 2, args.lease)
+            if not jobs:
+                # Jobs leased by other workers come back if those workers die
+                wait = queue.next_expiry()
+                if wait is None:
+                    break
+                time.sleep(min(wait + 0.1, 5.0))
+                continue
+            processed += len(jobs)
+            report.plan(len(jobs))
+            failures.extend(run_jobs(jobs, args.concurrency, args.stream))
+        if progress is not None:
+            progress.stop()
         
-        print(f"Generated: {filename}")
+        print(f"{worker_id}: {processed} jobs, {len(failures)} failed")
+        if queue.rejected:
+            print(f"{worker_id}: {queue.rejected} results dropped; their leases had passed to another worker")
+        root, ext = os.path.splitext(args.report)
+        print_run_summary(f"{root}.{worker_id}{ext}")
+        queue.export_manifest(args.manifest)
+        return 1 if failures else 0
+    finally:
+        heartbeat.stop()
+        queue.close()
+        token_budgets.save()
+        if response_cache is not None:
+            response_cache.close()
+        if dedup_index is not None:
+            dedup_index.close()
+
+# Parse a half-open "START:END" job range; either side may be left empty
+def parse_job_range(value):
+    start, sep, end = value.partition(':')
+    try:
+        if not sep:
+            raise ValueError
+        start = int(start) if start else 0
+        end = int(end) if end else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected START:END, got {value!r}")
+    if start < 0 or (end is not None and end < start):
+        raise argparse.ArgumentTypeError(f"invalid job range {value!r}")
+    return start, end
 
 def parse_arguments():
-    parser = argparse.ArgumentParser(description='Generate synthetic data files for SonderMind platforms')
+    parser = argparse.ArgumentParser(description='Generate synthetic data files for company platforms (SonderMind by default)')
+    
+    parser.add_argument('--companies',
+                        help='JSON manifest of companies (profile, file types, themes, description, customers, output root, '
+                             'quota) to generate for in one run')
     
-    parser.add_argument('--platforms', '-p', nargs='+', choices=['Coda', 'Dialpad', 'Slack', 'all'],
-                        default=['all'], help='Platforms to generate data for (default: all)')
+    parser.add_argument('--platforms', '-p', nargs='+', default=['all'],
+                        help='Platforms from each company\'s file generation types to generate data for, or "all" (default: all)')
     
     parser.add_argument('--count', '-c', type=int,
                         help='Number of files to generate per platform (default: all available types)')
     
-    return parser.parse_args()
+    sizing = parser.add_mutually_exclusive_group()
+    sizing.add_argument('--per-type', type=int, default=1,
+                        help='Number of documents to generate for each file type (default: 1)')
+    
+    sizing.add_argument('--total', type=int,
+                        help='Total number of documents per company, spread evenly across the selected file types')
+    
+    parser.add_argument('--seed', type=int,
+                        help='Seed for file type and theme selection; the same seed and inputs give the same plan '
+                             '(default: random, printed at startup)')
+    
+    parser.add_argument('--plan-only', action='store_true',
+                        help='Write the planned jobs to --plan and exit without generating anything')
+    
+    parser.add_argument('--plan', default=DEFAULT_PLAN_PATH,
+                        help=f'JSONL file written by --plan-only (default: {DEFAULT_PLAN_PATH})')
+    
+    parser.add_argument('--job-range', type=parse_job_range, metavar='START:END',
+                        help='Only run planned jobs with seq in [START, END), to split one plan across machines')
+    
+    parser.add_argument('--workers', type=int,
+                        help='Split the run across this many local worker processes sharing a job queue and the '
+                             '--rpm/--tpm budget; with --enqueue, the number of workers that will share it')
+    
+    parser.add_argument('--enqueue', action='store_true',
+                        help='Plan the run into --queue and exit, for workers on other hosts to claim')
+    
+    parser.add_argument('--worker', action='store_true',
+                        help='Claim and run jobs from --queue until it is drained')
+    
+    parser.add_argument('--worker-id',
+                        help='Name recorded on jobs this worker claims (default: host name and process id)')
+    
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_PATH,
+                        help=f'SQLite job queue shared by workers (default: {DEFAULT_QUEUE_PATH})')
+    
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS,
+                        help=f'Seconds a claimed job stays leased without a heartbeat from its worker, which renews it every '
+                             f'third of that, before others may retake it (default: {DEFAULT_LEASE_SECONDS:g})')
+    
+    parser.add_argument('--report', default=DEFAULT_REPORT_PATH,
+                        help=f'JSON report of stage latencies, throughput, tokens and estimated cost (default: {DEFAULT_REPORT_PATH})')
+    
+    parser.add_argument('--progress', type=float, nargs='?', const=DEFAULT_PROGRESS_INTERVAL, metavar='SECONDS',
+                        help=f'Print a progress line every SECONDS while generating (default interval: {DEFAULT_PROGRESS_INTERVAL:g})')
+    
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST_PATH,
+                        help=f'JSONL manifest recording every generated document (default: {DEFAULT_MANIFEST_PATH})')
+    
+    parser.add_argument('--labels', metavar='PATH',
+                        help='After the run, export every document\'s themes, profile sections and generation '
+                             'parameters from the manifest to a label store; .jsonl, or .parquet / .arrow with pyarrow')
+    
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip documents the run journal records as done and only generate the rest')
+    
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only regenerate documents whose inputs (profile sections, themes, template, file type, '
+                             'schema or model) changed since the run recorded in --manifest, reusing its seed')
+    
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL_PATH,
+                        help=f'SQLite journal of job status used by --resume (default: {DEFAULT_JOURNAL_PATH})')
+    
+    parser.add_argument('--concurrency', '-j', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Maximum number of generation requests in flight at once (default: {DEFAULT_CONCURRENCY})')
+    
+    parser.add_argument('--pool-size', type=int,
+                        help='Keep-alive HTTP connections held by the shared API client (default: same as --concurrency)')
+    
+    parser.add_argument('--base-url',
+                        help='Override the Anthropic API base URL, e.g. a local mock server (default: SDK default)')
+    
+    parser.add_argument('--no-prompt-cache', action='store_true',
+                        help='Do not mark the static system prompt for API prompt caching; the API only caches prompts of '
+                             'at least 1024 tokens (Sonnet) and ignores the marker on shorter ones')
+    
+    parser.add_argument('--rpm', type=int,
+                        help='Client-side limit on API requests per minute (default: unlimited)')
+    
+    parser.add_argument('--tpm', type=int,
+                        help='Client-side limit on input + output tokens per minute (default: unlimited)')
+    
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f'Retries for throttled (429/529) or failed API calls before giving up (default: {DEFAULT_MAX_RETRIES})')
+    
+    parser.add_argument('--max-tokens', type=int,
+                        help='max_tokens for every request instead of per-type budgets learned from earlier output '
+                             f'lengths (default: learned, {DEFAULT_MAX_TOKENS} until a type has enough history)')
+    
+    parser.add_argument('--token-budgets', default=DEFAULT_TOKEN_BUDGETS_PATH,
+                        help=f'JSON history of output lengths per document type (default: {DEFAULT_TOKEN_BUDGETS_PATH})')
+    
+    parser.add_argument('--max-continuations', type=int, default=DEFAULT_MAX_CONTINUATIONS,
+                        help=f'Follow-up requests allowed to finish a response cut off at max_tokens (default: {DEFAULT_MAX_CONTINUATIONS})')
+    
+    parser.add_argument('--json-repairs', type=int, default=DEFAULT_JSON_REPAIRS,
+                        help=f'Follow-up requests allowed to fix a JSON document that fails its schema (default: {DEFAULT_JSON_REPAIRS})')
+    
+    parser.add_argument('--dedup', choices=DEDUP_MODES, default='off',
+                        help='Check each document against the others of its platform and type as it is written: '
+                             'flag near-duplicates in the manifest, or regenerate them once with a request for a '
+                             'distinct document (default: off)')
+    
+    parser.add_argument('--dedup-threshold', type=float, default=near_duplicates.DEFAULT_THRESHOLD,
+                        help=f'Estimated Jaccard similarity at which documents count as near-duplicates '
+                             f'(default: {near_duplicates.DEFAULT_THRESHOLD})')
+    
+    parser.add_argument('--dedup-index', default=DEFAULT_DEDUP_INDEX_PATH,
+                        help=f'SQLite index of document signatures used by --dedup (default: {DEFAULT_DEDUP_INDEX_PATH})')
+    
+    parser.add_argument('--cache', choices=CACHE_MODES, default='off',
+                        help='Reuse responses for byte-identical prompts from an on-disk cache (default: off)')
+    
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH,
+                        help=f'SQLite file backing the response cache (default: {DEFAULT_CACHE_PATH})')
+    
+    parser.add_argument('--cache-max-mb', type=float,
+                        help='Evict least recently used cache entries above this size in MB (default: unbounded)')
+    
+    parser.add_argument('--cache-max-age', type=float,
+                        help='Evict cache entries older than this many days (default: never)')
+    
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream responses and write each file incrementally, recording time-to-first-token')
+    
+    parser.add_argument('--output-format', choices=list(OUTPUT_FORMATS), default='files',
+                        help='Write one file per document, or pack documents into compressed JSONL or tar '
+                             'shards with a random-access index (default: files)')
+    
+    parser.add_argument('--shard-mb', type=float, default=DEFAULT_SHARD_BYTES / (1024 * 1024),
+                        help=f'Maximum compressed size of one packed shard in MB (default: {DEFAULT_SHARD_BYTES // (1024 * 1024)})')
+    
+    parser.add_argument('--batch', action='store_true',
+                        help='Submit all jobs through the Message Batches API instead of one call per file')
+    
+    parser.add_argument('--batch-resume', action='store_true',
+                        help='Resume polling the batches recorded by an interrupted --batch run')
+    
+    parser.add_argument('--batch-state', default=DEFAULT_BATCH_STATE_PATH,
+                        help=f'File recording submitted batches and their jobs (default: {DEFAULT_BATCH_STATE_PATH})')
+    
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_REQUESTS,
+                        help=f'Maximum requests per submitted batch (default: {MAX_BATCH_REQUESTS})')
+    
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f'Seconds between batch status polls (default: {DEFAULT_POLL_INTERVAL:g})')
+    
+    args = parser.parse_args()
+    if args.per_type < 1:
+        parser.error('--per-type must be at least 1')
+    if args.total is not None and args.total < 1:
+        parser.error('--total must be at least 1')
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    if args.pool_size is not None and args.pool_size < 1:
+        parser.error('--pool-size must be at least 1')
+    for name in ('rpm', 'tpm'):
+        if getattr(args, name) is not None and getattr(args, name) < 1:
+            parser.error(f'--{name} must be at least 1')
+    if args.max_retries < 0:
+        parser.error('--max-retries cannot be negative')
+    if args.max_tokens is not None and not 1 <= args.max_tokens <= MAX_OUTPUT_TOKENS:
+        parser.error(f'--max-tokens must be between 1 and {MAX_OUTPUT_TOKENS}')
+    if args.max_continuations < 0:
+        parser.error('--max-continuations cannot be negative')
+    if args.json_repairs < 0:
+        parser.error('--json-repairs cannot be negative')
+    if args.cache_max_mb is not None and args.cache_max_mb <= 0:
+        parser.error('--cache-max-mb must be positive')
+    if args.cache_max_age is not None and args.cache_max_age <= 0:
+        parser.error('--cache-max-age must be positive')
+    if not 1 <= args.batch_size <= MAX_BATCH_REQUESTS:
+        parser.error(f'--batch-size must be between 1 and {MAX_BATCH_REQUESTS}')
+    if args.poll_interval <= 0:
+        parser.error('--poll-interval must be positive')
+    if args.shard_mb <= 0:
+        parser.error('--shard-mb must be positive')
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.lease <= 0:
+        parser.error('--lease must be positive')
+    if args.progress is not None and args.progress <= 0:
+        parser.error('--progress must be positive')
+    if args.worker and (args.workers or args.enqueue):
+        parser.error('--worker cannot be combined with --workers or --enqueue')
+    if (args.worker or args.workers or args.enqueue) and (args.batch or args.batch_resume):
+        parser.error('the Message Batches API cannot be combined with a worker queue')
+    if (args.worker or args.workers or args.enqueue) and args.output_format != 'files':
+        parser.error('workers share one output tree; use --output-format files')
+    if args.stream and args.output_format != 'files':
+        parser.error('--stream writes each document to its own file; use --output-format files')
+    if args.stream and (args.batch or args.batch_resume):
+        parser.error('--stream cannot be combined with --batch')
+    if not 0 < args.dedup_threshold <= 1:
+        parser.error('--dedup-threshold must be in (0, 1]')
+    if args.dedup == 'regenerate' and (args.batch or args.batch_resume):
+        parser.error('--dedup regenerate sends follow-up requests directly; use --dedup flag with --batch')
+    if args.incremental and (args.resume or args.batch_resume):
+        parser.error('--incremental cannot be combined with --resume or --batch-resume')
+    if args.labels:
+        try:
+            label_format(args.labels)
+        except ValueError as e:
+            parser.error(f'--labels: {e}')
+    return args
 
 def main():
-    # Parse command line arguments first
+    # `clean` re-processes an existing output tree instead of generating
+    if sys.argv[1:2] == ["clean"]:
+        return content_cleaner.main(sys.argv[2:])
+    # `dedup` reports near-duplicate clusters in an existing output tree
+    if sys.argv[1:2] == ["dedup"]:
+        return near_duplicates.main(sys.argv[2:])
+    # `labels` exports ground-truth labels from an existing manifest
+    if sys.argv[1:2] == ["labels"]:
+        return label_store.main(sys.argv[2:])
+    
+    # Parse command line arguments before any I/O, so --help and bad flags return at once
     args = parse_arguments()
+    if args.worker:
+        return run_worker(args)
     
-    # Determine which platforms to generate data for
-    if 'all' in args.platforms:
-        platforms = ['Coda', 'Dialpad', 'Slack']
-    else:
-        platforms = args.platforms
+    # Load necessary data and resolve every company's document types once
+    companies = load_companies(args.companies)
+    loaded = {}
+    tenants = []
+    for company in companies:
+        registry = build_company_registry(company, loaded)
+        
+        # Determine which platforms to generate data for
+        if 'all' in args.platforms:
+            platforms = list(registry)
+        else:
+            platforms = [platform for platform in args.platforms if platform in registry]
+        tenants.append((company, registry, platforms))
+    
+    if 'all' not in args.platforms:
+        known = {platform for _, registry, _ in tenants for platform in registry}
+        unknown = [platform for platform in args.platforms if platform not in known]
+        if unknown:
+            print(f"Unknown platform(s): {', '.join(unknown)}. Available: {', '.join(sorted(known))}")
+            return 2
+    
+    # Plan every job up front; with the same inputs and seed every machine plans the same jobs
+    global report
+    report = RunReport(MODEL)
+    previous = latest_records(args.manifest) if args.incremental else {}
+    if args.seed is None and previous:
+        # Replanning with the recorded seed picks the same themes for documents whose inputs did not change
+        args.seed = recorded_seed(previous)
+    if args.seed is None and args.resume:
+        # A resumed run replans its unfinished jobs with the seed they were first planned with
+        args.seed = resumed_seed(args)
+    if args.seed is None and args.batch_resume:
+        # Resumed batches are replanned with the seed they were submitted under to rebuild their prompts
+        state = load_batch_state(args.batch_state)
+        args.seed = recorded_seed({job["id"]: job for batch in state["batches"] for job in batch["jobs"].values()})
+    if args.seed is None:
+        args.seed = random.SystemRandom().getrandbits(32)
+    print(f"Seed: {args.seed}")
+    jobs = build_plan(tenants, args)
+    
+    # Diff the plan against the last manifest and keep only documents whose inputs changed
+    carried = {}
+    if args.incremental:
+        stale, unchanged, reasons = diff_plan(jobs, previous, OUTPUT_FORMATS[args.output_format] is not None)
+        carried = {record["id"]: record for record in unchanged}
+        changes = ", ".join(f"{name}: {count}" for name, count in reasons.most_common())
+        print(f"Incremental: {len(unchanged)} of {len(jobs)} documents unchanged, {len(stale)} to regenerate"
+              + (f" ({changes})" if changes else ""))
+    if args.plan_only:
+        jobs = [job for job in jobs if job["id"] not in carried]
+        write_plan(jobs, args.plan)
+        print(f"Planned {len(jobs)} jobs; wrote {args.plan}")
+        return 0
+    if args.workers or args.enqueue:
+        return coordinate(jobs, args, carried)
+    jobs = [job for job in jobs if job["id"] not in carried]
     
     # Set up required directories
-    create_directories(platforms)
+    if args.output_format == 'files':
+        for company, _, platforms in tenants:
+            create_directories(platforms, company["output"])
     
-    # Load necessary data
-    file_types = load_file_generation_types()
-    themes = load_themes()
-    company_profile = load_company_profile()
+    # One API client and connection pool is shared by every worker
+    configure_client(args.base_url, args.pool_size or args.concurrency, not args.no_prompt_cache)
+    configure_rate_limits(args.rpm, args.tpm, args.max_retries)
+    configure_cache(args.cache, args.cache_path, args.cache_max_mb, args.cache_max_age)
+    validation_settings["repairs"] = args.json_repairs
+    configure_dedup(args.dedup, args.dedup_index, args.dedup_threshold,
+                    reset=not (args.resume or args.batch_resume or args.incremental))
+    configure_token_budgets(args.token_budgets, args.max_tokens, args.max_continuations)
+    
+    if (args.batch or args.batch_resume) and not has_api_key():
+        print("ANTHROPIC_API_KEY not found in environment variables; --batch requires a real API key.")
+        return 1
+    
+    global manifest, journal
+    manifest = ManifestWriter(args.manifest, append=args.resume or args.batch_resume)
+    journal = RunJournal(args.journal, reset=not (args.resume or args.batch_resume))
+    journal.set_seed(args.seed)
+    if OUTPUT_FORMATS[args.output_format]:
+        for company, _, _ in tenants:
+            if company["output"] not in shard_writers:
+                shard_writers[company["output"]] = ShardWriter(
+                    company["output"], OUTPUT_FORMATS[args.output_format], int(args.shard_mb * 1024 * 1024),
+                    append=args.resume or args.batch_resume or args.incremental)
     
     try:
-        # Generate files for each platform
-        if 'Coda' in platforms:
-            generate_coda_files(file_types, themes, company_profile, args.count)
-            
-        if 'Dialpad' in platforms:
-            generate_dialpad_files(file_types, themes, company_profile, args.count)
-            
-        if 'Slack' in platforms:
-            generate_slack_files(file_types, themes, company_profile, args.count)
+        if args.batch_resume:
+            jobs, failures = resume_batch_jobs(args.batch_state, args.poll_interval, planned=jobs)
+            if failures:
+                print(f"{len(failures)} of {len(jobs)} files failed to generate.")
+                return 1
+            print("\nAll files generated successfully!")
+            return 0
+        
+        # Unchanged documents keep their files and manifest records
+        for record in carried.values():
+            manifest.write(record)
+            journal.mark(record["id"], "done")
+        
+        # Skip documents an earlier run already finished
+        if args.resume:
+            completed = journal.completed_ids()
+            remaining = [job for job in jobs if job["id"] not in completed]
+            print(f"Resuming: {len(jobs) - len(remaining)} of {len(jobs)} documents already done")
+            jobs = remaining
+        journal.add_pending(job["id"] for job in jobs)
+        report.plan(len(jobs))
+        
+        progress = ProgressLine(report, args.progress).start() if args.progress else None
+        try:
+            if args.batch:
+                failures = run_batch_jobs(jobs, args.batch_state, args.batch_size, args.poll_interval)
+            else:
+                failures = run_jobs(jobs, args.concurrency, args.stream)
+        finally:
+            if progress is not None:
+                progress.stop()
+        print_run_summary(args.report)
+        if failures:
+            print(f"{len(failures)} of {len(jobs)} files failed to generate.")
+            return 1
             
         print("\nAll files generated successfully!")
             
     except Exception as e:
         print(f"Error generating files: {e}")
         return 1
+    finally:
+        # Flushing the last blocks records their documents, so this comes first
+        for writer in shard_writers.values():
+            writer.close()
+            print(writer.summary())
+        manifest.close()
+        journal.close()
+        token_budgets.save()
+        if response_cache is not None:
+            response_cache.close()
+        if dedup_index is not None:
+            dedup_index.close()
+        # Labels come from the manifest, so only once it is complete
+        write_labels(args)
         
     return 0
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main()) 
\ No newline at end of file
@@ -0,0 +1,72 @@
+"""Fingerprints of the inputs each generated document depends on.
+
+A document is built from a handful of inputs: the profile sections excerpted
+into its prompt, its prompt template, the company description, its entry in
+file_generation_types.json together with the platform rules that apply to
+it, its output schema, the themes chosen for it and the model settings.
+Each input is hashed separately into the job's "inputs", and fingerprint()
+hashes them together; both are recorded in the manifest.
+
+An --incremental run diffs the new plan against the last manifest: documents
+whose fingerprint is unchanged and whose output is still on disk are carried
+over as they are, and only the rest are generated again. The names of the
+inputs that differ explain why each stale document is rebuilt. Placeholder
+documents of a run without an API key are always stale.
+"""
+import collections
+import hashlib
+import json
+import os
+
+from manifest import read_manifest
+
+# Short hex digest of any JSON-serializable values
+def digest(*parts):
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+def fingerprint(inputs):
+    return digest(inputs)
+
+# The last record of every document in a manifest; later records supersede earlier ones
+def latest_records(path):
+    if not os.path.exists(path):
+        return {}
+    return {record["id"]: record for record in read_manifest(path)}
+
+# Run seed most of the recorded documents were planned with, so an incremental run replans the same themes
+def recorded_seed(records):
+    seeds = collections.Counter(record["run_seed"] for record in records.values() if "run_seed" in record)
+    return seeds.most_common(1)[0][0] if seeds else None
+
+# Whether a recorded document's output is still there, in the output format of this run
+def output_exists(record, root, packed=False):
+    if packed != ("shard" in record):
+        return False
+    if packed:
+        return os.path.exists(os.path.join(root, record["shard"]))
+    return os.path.exists(record["filename"])
+
+# Split planned jobs into stale ones and the previous records of unchanged ones,
+# counting why stale documents are rebuilt by the name of each changed input
+def diff_plan(jobs, previous, packed=False):
+    stale = []
+    unchanged = []
+    reasons = collections.Counter()
+    for job in jobs:
+        record = previous.get(job["id"])
+        if record is None:
+            reasons["new"] += 1
+        elif record.get("fingerprint") != job["fingerprint"]:
+            recorded = record.get("inputs", {})
+            changed = [name for name, value in job["inputs"].items() if recorded.get(name) != value]
+            reasons.update(changed or ["fingerprint"])
+        elif record.get("placeholder"):
+            reasons["placeholder"] += 1
+        elif not output_exists(record, job["output"], packed):
+            reasons["output"] += 1
+        else:
+            unchanged.append(record)
+            continue
+        stale.append(job)
+    return stale, unchanged, reasons
@@ -0,0 +1,255 @@
+"""Shared SQLite job queue for splitting one run across worker processes.
+
+A coordinator plans the run and enqueues every job; workers, on this host or
+any other that shares the file, claim small batches under a time-limited
+lease, generate them and mark them done. While a worker is generating, a
+LeaseHeartbeat renews its leases, so a slow document is not handed to a
+second worker; a lease that expires all the same (the worker died or
+stalled) makes its jobs claimable again, up to MAX_ATTEMPTS claims. A
+worker's results are only accepted for jobs it still holds the lease on, so
+a stalled worker that wakes up cannot overwrite the result of the worker
+that took its jobs over.
+
+The queue doubles as the run journal and the manifest for workers: it has
+the same mark() and write() methods, so finished documents and their
+manifest records land in one place and export_manifest() writes the merged
+manifest in plan order. The global rate budget and worker count are stored
+alongside the jobs so each worker can take its share, and so is the run's
+seed, which a resumed coordinator replans with.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Claims of one job before it is given up as failed
+MAX_ATTEMPTS = 3
+
+DEFAULT_LEASE_SECONDS = 600.0
+
+class JobQueue:
+    # `worker` is the id a worker process claims jobs under; the coordinator opens the queue without one
+    def __init__(self, path, worker=None):
+        import sqlite3
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.worker = worker
+        # Results dropped because this worker had lost the job's lease
+        self.rejected = 0
+        self.lock = threading.Lock()
+        # Autocommit, so claims can take the write lock explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                system_key TEXT,
+                status TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                record TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_seq ON jobs (status, seq)")
+        # System prompts are shared by every job of a type, so they are stored once
+        self.conn.execute("CREATE TABLE IF NOT EXISTS systems (key TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.closed = False
+
+    # Add planned jobs; with reset the queue is emptied first, otherwise done jobs are kept.
+    # Jobs with a record in `done` (id -> manifest record) go in already done with that record.
+    def enqueue(self, jobs, reset=False, done=None):
+        done = done or {}
+        rows = []
+        systems = {}
+        for job in jobs:
+            system = job.get("system")
+            system_key = None
+            if system:
+                system_key = hashlib.sha256(system.encode("utf-8")).hexdigest()
+                systems[system_key] = system
+            payload = {key: value for key, value in job.items() if key != "system"}
+            record = done.get(job["id"])
+            rows.append((job["id"], job["seq"], json.dumps(payload, ensure_ascii=False), system_key,
+                         "pending" if record is None else "done",
+                         None if record is None else json.dumps(record, ensure_ascii=False)))
+
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if reset:
+                    self.conn.execute("DELETE FROM jobs")
+                    self.conn.execute("DELETE FROM systems")
+                self.conn.executemany("INSERT OR IGNORE INTO systems (key, text) VALUES (?, ?)", systems.items())
+                self.conn.executemany(
+                    "INSERT INTO jobs (id, seq, payload, system_key, status, record) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET seq = excluded.seq, payload = excluded.payload, "
+                    "system_key = excluded.system_key, status = excluded.status, worker = NULL, "
+                    "lease_expires = NULL, attempts = 0, error = NULL, record = excluded.record "
+                    "WHERE jobs.status != 'done'",
+                    rows,
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    # Lease up to `limit` jobs to this worker, lowest seq first, including jobs whose lease expired
+    def claim(self, limit, lease=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'lease expired too many times', worker = NULL "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, MAX_ATTEMPTS),
+                )
+                rows = self.conn.execute(
+                    "SELECT jobs.id, jobs.payload, systems.text FROM jobs "
+                    "LEFT JOIN systems ON systems.key = jobs.system_key "
+                    "WHERE jobs.status = 'pending' OR (jobs.status = 'leased' AND jobs.lease_expires < ?) "
+                    "ORDER BY jobs.seq LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                    "WHERE id = ?",
+                    [(self.worker, now + lease, row[0]) for row in rows],
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        jobs = []
+        for _, payload, system in rows:
+            job = json.loads(payload)
+            job["system"] = system
+            jobs.append(job)
+        return jobs
+
+    # Extend every lease this worker still holds by `lease` seconds from now; returns how many
+    def renew(self, lease=DEFAULT_LEASE_SECONDS):
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE status = 'leased' AND worker = ?",
+                (time.time() + lease, self.worker),
+            )
+        return cursor.rowcount
+
+    # SQL condition and parameters restricting an update to jobs this worker holds the lease on
+    def _held(self):
+        if self.worker is None:
+            return "", ()
+        return " AND status = 'leased' AND worker = ?", (self.worker,)
+
+    # Store a finished document's manifest record (ManifestWriter interface)
+    def write(self, record):
+        condition, params = self._held()
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET record = ? WHERE id = ?" + condition,
+                              (json.dumps(record, ensure_ascii=False), record["id"], *params))
+
+    # Set a job's final status (RunJournal interface); returns False if the lease was lost
+    def mark(self, job_id, status, error=None):
+        condition, params = self._held()
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL WHERE id = ?" + condition,
+                (status, error, job_id, *params),
+            )
+            if not cursor.rowcount:
+                self.rejected += 1
+        return bool(cursor.rowcount)
+
+    # Number of jobs in each status
+    def counts(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    # Seconds until the earliest live lease held by anyone expires, or None if no job is leased
+    def next_expiry(self):
+        with self.lock:
+            expires = self.conn.execute("SELECT MIN(lease_expires) FROM jobs WHERE status = 'leased'").fetchone()[0]
+        return None if expires is None else max(0.0, expires - time.time())
+
+    # Record the run-wide rate budget and how many workers share it
+    def set_budget(self, requests_per_minute, tokens_per_minute, workers):
+        budget = {"rpm": requests_per_minute, "tpm": tokens_per_minute, "workers": workers}
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('budget', ?)", (json.dumps(budget),))
+
+    # Record the seed the queued jobs were planned with (RunJournal interface)
+    def set_seed(self, seed):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seed', ?)", (str(seed),))
+
+    # Seed the queued jobs were planned with, or None if none was recorded
+    def run_seed(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'seed'").fetchone()
+        return None if row is None else int(row[0])
+
+    # This worker's share of the run-wide budget as (rpm, tpm); None means unlimited
+    def worker_budget(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'budget'").fetchone()
+        if row is None:
+            return None, None
+        budget = json.loads(row[0])
+        workers = max(1, budget["workers"])
+        return tuple(None if budget[key] is None else max(1, budget[key] // workers) for key in ("rpm", "tpm"))
+
+    # Write the records of every done job, placeholders included, in plan order, as one JSONL manifest
+    def export_manifest(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        count = 0
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT record FROM jobs WHERE status IN ('done', 'placeholder') AND record IS NOT NULL ORDER BY seq")
+            with open(tmp_path, 'w') as f:
+                for (record,) in rows:
+                    f.write(record + "\n")
+                    count += 1
+        os.replace(tmp_path, path)
+        return count
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.conn.close()
+                self.closed = True
+
+# Renews a worker's leases every third of the lease period until stopped
+class LeaseHeartbeat:
+    def __init__(self, queue, lease=DEFAULT_LEASE_SECONDS):
+        self.queue = queue
+        self.lease = lease
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.lease / 3):
+            self.queue.renew(self.lease)
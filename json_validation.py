@@ -0,0 +1,100 @@
+"""Parse and schema-check generated JSON documents.
+
+Schemas live in schemas/<name>.json and use a small subset of JSON Schema:
+type (a name or a list of names), enum, required, properties,
+additionalProperties (false only), items, minItems, oneOf and the
+"date-time" format. That covers the Dialpad and Slack structures the prompts
+ask for without adding a dependency.
+"""
+import json
+import os
+from datetime import datetime
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas")
+
+# Stop collecting after this many errors; the repair prompt only needs a sample
+MAX_ERRORS = 20
+
+TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+_schemas = {}
+
+# Schema by name, read from disk once
+def load_schema(name):
+    if name not in _schemas:
+        with open(os.path.join(SCHEMA_DIR, f"{name}.json"), 'r') as f:
+            _schemas[name] = json.load(f)
+    return _schemas[name]
+
+# Parse `text` and check it against `schema`; returns a list of error messages
+def check_document(text, schema):
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError as e:
+        return [f"invalid JSON: {e}"]
+    errors = []
+    validate(value, schema, "$", errors)
+    return errors
+
+def validate(value, schema, path, errors):
+    if len(errors) >= MAX_ERRORS:
+        return
+
+    types = schema.get("type")
+    if types is not None:
+        types = types if isinstance(types, list) else [types]
+        if not any(TYPE_CHECKS[name](value) for name in types):
+            errors.append(f"{path}: expected {' or '.join(types)}, got {type(value).__name__}")
+            return
+
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: expected one of {schema['enum']}, got {value!r}")
+        return
+
+    if schema.get("format") == "date-time" and isinstance(value, str) and not is_datetime(value):
+        errors.append(f"{path}: {value!r} is not an ISO timestamp")
+
+    if "oneOf" in schema:
+        attempts = []
+        for option in schema["oneOf"]:
+            option_errors = []
+            validate(value, option, path, option_errors)
+            if not option_errors:
+                break
+            attempts.append(option_errors)
+        else:
+            # Report the closest alternative
+            errors.extend(min(attempts, key=len))
+
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required field '{key}'")
+        properties = schema.get("properties", {})
+        for key, item in value.items():
+            if key in properties:
+                validate(item, properties[key], f"{path}.{key}", errors)
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected field '{key}'")
+
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                validate(item, schema["items"], f"{path}[{i}]", errors)
+
+def is_datetime(value):
+    try:
+        datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return True
+    except ValueError:
+        return False
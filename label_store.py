@@ -0,0 +1,180 @@
+"""Ground-truth label export: one row of labels per generated document.
+
+Every manifest record already carries what a document was generated from.
+export_labels() flattens those records into a fixed set of columns, keyed by
+document id: the sampled theme categories and sub-themes, the profile
+sections excerpted into the prompt, and the generation parameters (model,
+template, schema, seeds and input fingerprint). Theme-extraction evaluations
+can then load labels directly instead of re-deriving them from the prompts.
+
+The store format follows the output path's extension:
+
+    .jsonl              one JSON object per line, no extra dependencies
+    .parquet            Parquet, compressed and columnar (needs pyarrow)
+    .arrow / .feather   Arrow IPC file, memory-mappable with zero-copy reads (needs pyarrow)
+
+Records are streamed into the store in batches of BATCH_ROWS rows, so the
+row data of a large corpus is never held in memory at once. When a manifest
+has more than one record for a document, e.g. after --resume, the last one
+wins. Placeholder documents written by a run without an API key have no
+labels to give and are left out.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from manifest import read_manifest
+from near_duplicates import batched
+
+DEFAULT_MANIFEST_PATH = "output/manifest.jsonl"
+DEFAULT_LABELS_PATH = "output/labels.jsonl"
+
+# Rows per Parquet row group / Arrow record batch
+BATCH_ROWS = 65536
+
+LABEL_FORMATS = {".jsonl": "jsonl", ".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+
+# Label columns and their Arrow types, by name
+COLUMNS = (
+    ("id", "string"),
+    ("company", "string"),
+    ("platform", "string"),
+    ("doc_type", "string"),
+    ("format", "string"),
+    ("index", "int64"),
+    ("filename", "string"),
+    ("theme_categories", "list<string>"),
+    ("subthemes", "list<string>"),
+    ("profile_sections", "list<string>"),
+    ("model", "string"),
+    ("template", "string"),
+    ("schema", "string"),
+    ("seed", "int64"),
+    ("run_seed", "int64"),
+    ("fingerprint", "string"),
+    ("bytes", "int64"),
+    ("near_duplicate_of", "string"),
+)
+
+def label_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in LABEL_FORMATS:
+        raise ValueError(f"unknown label store extension {extension!r}; use one of {', '.join(LABEL_FORMATS)}")
+    return LABEL_FORMATS[extension]
+
+# Label row of one manifest record
+def label_row(record):
+    themes = record.get("themes") or []
+    return {
+        "id": record["id"],
+        "company": record.get("company"),
+        "platform": record.get("platform"),
+        "doc_type": record.get("doc_type"),
+        "format": record.get("format"),
+        "index": record.get("index"),
+        "filename": record.get("filename"),
+        "theme_categories": [theme["category"] for theme in themes],
+        "subthemes": [theme["subtheme"] for theme in themes],
+        "profile_sections": record.get("sections") or [],
+        "model": record.get("model"),
+        "template": record.get("template"),
+        "schema": record.get("schema"),
+        "seed": record.get("seed"),
+        "run_seed": record.get("run_seed"),
+        "fingerprint": record.get("fingerprint"),
+        "bytes": record.get("bytes"),
+        "near_duplicate_of": record.get("near_duplicate_of"),
+    }
+
+# Label rows of a manifest in order, skipping records a later one for the same id supersedes
+# and placeholder documents, whose text contains none of their themes
+def iter_labels(manifest_path):
+    last = {}
+    for line_number, record in enumerate(read_manifest(manifest_path)):
+        last[record["id"]] = line_number
+    for line_number, record in enumerate(read_manifest(manifest_path)):
+        if last[record["id"]] == line_number and not record.get("placeholder"):
+            yield label_row(record)
+
+def arrow_schema(pa):
+    types = {"string": pa.string(), "int64": pa.int64(), "list<string>": pa.list_(pa.string())}
+    return pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+# Write the labels of every document in `manifest_path` to `path`; returns the number of rows
+def export_labels(manifest_path, path):
+    store = label_format(path)
+    if store != "jsonl":
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError("Parquet and Arrow label stores need pyarrow (pip install pyarrow); "
+                               "use a .jsonl path without it")
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    count = 0
+    try:
+        if store == "jsonl":
+            with open(tmp_path, 'w') as f:
+                for row in iter_labels(manifest_path):
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    count += 1
+        else:
+            schema = arrow_schema(pa)
+            if store == "parquet":
+                import pyarrow.parquet as pq
+                writer = pq.ParquetWriter(tmp_path, schema, compression="zstd")
+            else:
+                import pyarrow.ipc
+                writer = pa.ipc.new_file(tmp_path, schema)
+            try:
+                for rows in batched(iter_labels(manifest_path), BATCH_ROWS):
+                    batch = pa.RecordBatch.from_pylist(rows, schema=schema)
+                    if store == "parquet":
+                        writer.write_batch(batch)
+                    else:
+                        writer.write(batch)
+                    count += len(rows)
+            finally:
+                writer.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog='generate_synthetic_data.py labels',
+                                     description='Export ground-truth theme labels of generated documents')
+
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST_PATH,
+                        help=f'Manifest of the documents to export labels for (default: {DEFAULT_MANIFEST_PATH})')
+
+    parser.add_argument('--output', '-o', default=DEFAULT_LABELS_PATH,
+                        help=f'Label store to write; .jsonl, .parquet or .arrow (default: {DEFAULT_LABELS_PATH})')
+
+    args = parser.parse_args(argv)
+    try:
+        label_format(args.output)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    start = time.perf_counter()
+    try:
+        count = export_labels(args.manifest, args.output)
+    except (OSError, RuntimeError) as e:
+        print(f"Error exporting labels: {e}")
+        return 1
+    print(f"Wrote labels for {count} documents to {args.output} ({time.perf_counter() - start:.2f}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""Streaming JSONL manifest of generated documents.
+
+One line is appended per document as soon as its file is written, so the
+manifest never has to be held in memory and stays usable if a run dies
+partway through a large corpus.
+"""
+import json
+import os
+import threading
+
+class ManifestWriter:
+    def __init__(self, path, append=False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.file = open(path, 'a' if append else 'w')
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+# Iterate over the records of an existing manifest
+def read_manifest(path):
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,82 @@
+"""Minimal client for the Anthropic Message Batches API.
+
+The pinned SDK predates batches, so this speaks the HTTP protocol directly:
+submit a list of {custom_id, params} requests, poll the batch until its
+processing_status is "ended", then stream the JSONL results. The
+custom_id -> job mapping for every submitted batch is kept in a small JSON
+state file so an interrupted poll can be resumed later.
+"""
+import json
+import os
+import time
+
+DEFAULT_BASE_URL = "https://api.anthropic.com"
+API_VERSION = "2023-06-01"
+
+# The API accepts at most 100,000 requests per batch
+MAX_BATCH_REQUESTS = 100000
+
+class BatchClient:
+    def __init__(self, api_key, base_url=None, timeout=60.0, extra_headers=None):
+        import httpx
+        
+        base_url = base_url or os.getenv("ANTHROPIC_BASE_URL") or DEFAULT_BASE_URL
+        self.http = httpx.Client(
+            base_url=base_url.rstrip('/'),
+            timeout=timeout,
+            headers={
+                "x-api-key": api_key,
+                "anthropic-version": API_VERSION,
+                "content-type": "application/json",
+                **(extra_headers or {}),
+            },
+        )
+
+    # Create a batch from [{"custom_id": ..., "params": {...}}, ...]
+    def submit(self, requests):
+        response = self.http.post("/v1/messages/batches", json={"requests": requests})
+        response.raise_for_status()
+        return response.json()
+
+    def retrieve(self, batch_id):
+        response = self.http.get(f"/v1/messages/batches/{batch_id}")
+        response.raise_for_status()
+        return response.json()
+
+    # Poll until the batch has ended and return its final state
+    def wait(self, batch_id, poll_interval=30.0):
+        while True:
+            batch = self.retrieve(batch_id)
+            if batch["processing_status"] == "ended":
+                return batch
+            counts = batch.get("request_counts", {})
+            print(f"Batch {batch_id}: {counts.get('processing', '?')} requests still processing")
+            time.sleep(poll_interval)
+
+    # Stream the per-request results of an ended batch
+    def results(self, batch):
+        url = batch.get("results_url") or f"/v1/messages/batches/{batch['id']}/results"
+        with self.http.stream("GET", url) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    def close(self):
+        self.http.close()
+
+def load_batch_state(path):
+    if not os.path.exists(path):
+        return {"batches": []}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+# Write the state file atomically so a crash never leaves it half-written
+def save_batch_state(path, state):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,506 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Answers POST /v1/messages so the generation pipeline can be benchmarked
+without spending money on the real API:
+
+    python mock_server.py --port 8080 --latency 1.0 --latency-dist lognormal
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8080 ANTHROPIC_API_KEY=test \\
+        python generate_synthetic_data.py --concurrency 8
+
+Responses are canned but realistic: Dialpad call transcripts and Slack
+message arrays that match the schemas in schemas/, Slack text transcripts
+and Coda Markdown documents, picked from the platform named in the request
+and sometimes wrapped in the "Here's a ..." preambles and trailers the real
+model adds. Response latency is drawn from a configurable distribution,
+"stream": true requests are answered with server-sent events, and a share of
+requests can be failed with 429, 500 or 529 errors. Usage reports prompt
+caching the way the API does for cache_control system blocks of at least
+MIN_CACHEABLE_TOKENS tokens. A response longer than the request's max_tokens
+is cut off with stop_reason "max_tokens", and a request that sends the cut-off
+text back as the final assistant turn gets the rest of it.
+
+Connections are kept alive, and the number of requests, TCP connections and
+injected errors is printed on shutdown so connection reuse can be measured.
+
+The Message Batches endpoints are faked too: a submitted batch ends once
+--latency seconds have passed, and its results are served as JSONL.
+
+start_server() runs the mock in a background thread for benchmarks.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+# Injected errors: status -> (error type, message)
+ERRORS = {
+    429: ("rate_limit_error", "Number of requests has exceeded your rate limit"),
+    500: ("api_error", "Internal server error"),
+    529: ("overloaded_error", "Overloaded"),
+}
+
+# The API only caches prompt prefixes at least this long
+MIN_CACHEABLE_TOKENS = 1024
+
+# Share of a streamed response's latency spent before the first token
+STREAM_TTFT_SHARE = 0.3
+STREAM_CHUNK_WORDS = 8
+
+NAMES = ["Jordan Lee", "Priya Patel", "Marcus Chen", "Elena Garcia", "Sam Whitaker", "Aisha Okafor"]
+CHANNELS = ["#clinical-ops", "#provider-success", "#growth", "#support-escalations"]
+TOPICS = ["intake wait times", "insurance verification", "therapist matching", "session no-shows",
+          "the new onboarding flow", "psychiatry referrals", "copay questions", "provider churn"]
+WORDS = ("we saw clients providers sessions this week around the onboarding step and the matching "
+         "queue because insurance checks took longer than expected so follow-ups slipped and the team "
+         "plans to review scheduling data before the next sprint with clinical leads").split()
+
+def sentence(rng, low=8, high=22):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    words.insert(rng.randrange(len(words)), rng.choice(TOPICS))
+    return " ".join(words).capitalize() + "."
+
+def timestamps(rng, count):
+    moment = datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 300), hours=rng.randint(8, 17))
+    for _ in range(count):
+        moment += timedelta(seconds=rng.randint(5, 90))
+        yield moment
+
+def dialpad_call(rng):
+    lines = []
+    for moment in timestamps(rng, rng.randint(12, 40)):
+        name = rng.choice(NAMES)
+        if rng.random() < 0.1:
+            lines.append({"content": f"Action item: follow up on {rng.choice(TOPICS)}", "name": name,
+                          "time": moment.isoformat() + "Z", "type": "moment", "user_id": str(rng.getrandbits(40))})
+        else:
+            lines.append({"contact_id": str(rng.getrandbits(40)), "content": sentence(rng), "name": name,
+                          "time": moment.isoformat() + "Z", "type": "transcript"})
+    return json.dumps({"call_id": str(rng.getrandbits(48)), "lines": lines}, indent=2)
+
+def slack_messages(rng):
+    channel = rng.choice(CHANNELS)
+    messages = []
+    for moment in timestamps(rng, rng.randint(6, 20)):
+        message = {"user": rng.choice(NAMES), "timestamp": moment.isoformat(), "text": sentence(rng),
+                   "channel": channel}
+        if rng.random() < 0.3:
+            message["reactions"] = [{"name": rng.choice(["eyes", "white_check_mark", "+1"]),
+                                     "count": rng.randint(1, 4)}]
+        if rng.random() < 0.2:
+            message["replies"] = [{"user": rng.choice(NAMES), "timestamp": moment.isoformat(),
+                                   "text": sentence(rng, 4, 12)}]
+        messages.append(message)
+    return json.dumps(messages, indent=2)
+
+def slack_transcript(rng):
+    messages = [f"[{rng.choice(NAMES)}] {moment:%I:%M %p}\n{sentence(rng)}"
+                for moment in timestamps(rng, rng.randint(10, 30))]
+    return f"[Channel: {rng.choice(CHANNELS)}]\n\n" + "\n\n".join(messages)
+
+def coda_document(rng):
+    sections = [f"# {rng.choice(TOPICS).title()} Review", "", f"*Prepared by {rng.choice(NAMES)}*", ""]
+    for _ in range(rng.randint(3, 6)):
+        sections += [f"## {rng.choice(TOPICS).capitalize()}", "", " ".join(sentence(rng) for _ in range(3)), ""]
+        sections += [f"- {sentence(rng, 4, 10)}" for _ in range(rng.randint(2, 5))] + [""]
+    sections += ["| Metric | Value |", "| --- | --- |"]
+    sections += [f"| {rng.choice(TOPICS)} | {rng.randint(5, 95)}% |" for _ in range(4)]
+    return "\n".join(sections)
+
+# Canned response for a request, chosen from the platform and format it asks for
+def canned_text(request, rng, wrap_rate=0.0):
+    system = request.get("system") or ""
+    if isinstance(system, list):
+        system = " ".join(block.get("text", "") for block in system)
+    messages = request.get("messages", [])
+    prompt = system + " " + " ".join(message["content"] for message in messages if isinstance(message["content"], str))
+
+    if "Dialpad JSON export" in prompt:
+        text, kind = dialpad_call(rng), "JSON"
+    elif "JSON array of slack messages" in prompt:
+        text, kind = slack_messages(rng), "JSON"
+    elif "Slack messages" in prompt:
+        text, kind = slack_transcript(rng), "content"
+    else:
+        text, kind = coda_document(rng), "document"
+
+    # Repair follow-ups get the bare document back
+    if len(messages) == 1 and rng.random() < wrap_rate:
+        if kind == "JSON" and rng.random() < 0.5:
+            text = f"```json\n{text}\n```"
+        text = (f"Here's a realistic {kind.lower()} for this request:\n\n{text}\n\n"
+                f"This {kind} provides a realistic example of the requested content.")
+    return text
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+# Cut `text` to about `max_tokens` tokens; returns (text, stop reason) and keeps the rest for a continuation
+def truncate(text, max_tokens):
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text, "end_turn"
+    sent = text[:max_tokens * 4].rstrip()
+    with stats_lock:
+        stats["truncated"] += 1
+        remainders[hashlib.sha256(sent.encode()).hexdigest()] = text[len(sent):]
+    return sent, "max_tokens"
+
+# Build a Messages API response body
+def build_message(model, text, usage=None, stop_reason="end_turn"):
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": usage or {"input_tokens": 0, "output_tokens": len(text.split())},
+    }
+
+# Build a Message Batches API batch object
+def build_batch(batch_id, batch, base_url, now):
+    ended = now - batch["created"] >= MockMessagesHandler.latency
+    count = len(batch["results"])
+    errored = sum(1 for result in batch["results"] if result["result"]["type"] == "errored")
+    return {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {
+            "processing": 0 if ended else count,
+            "succeeded": count - errored if ended else 0,
+            "errored": errored if ended else 0,
+            "canceled": 0,
+            "expired": 0,
+        },
+        "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+    }
+
+# Request, connection and error counters, shared by all handler threads
+stats = {"requests": 0, "connections": 0, "streamed": 0, "truncated": 0, 429: 0, 500: 0, 529: 0}
+stats_lock = threading.Lock()
+
+# Submitted batches by id
+batches = {}
+
+# Hashes of system prompts already written to the simulated prompt cache
+cached_prefixes = set()
+
+# Unsent rest of responses cut off at max_tokens, by hash of the text that was sent
+remainders = {}
+
+class MockMessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    latency_dist = "fixed"
+    latency_jitter = 0.0
+    error_rates = {}
+    retry_after = 1.0
+    wrap_rate = 0.3
+    rng = random.Random()
+    rng_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with stats_lock:
+            stats["connections"] += 1
+
+    # Draw a response latency from the configured distribution
+    @classmethod
+    def sample_latency(cls):
+        mean, jitter = cls.latency, cls.latency_jitter
+        with cls.rng_lock:
+            if cls.latency_dist == "uniform":
+                value = cls.rng.uniform(mean - jitter, mean + jitter)
+            elif cls.latency_dist == "normal":
+                value = cls.rng.gauss(mean, jitter)
+            elif cls.latency_dist == "lognormal" and mean > 0:
+                # Parameterised so the distribution's mean is `mean` and its standard deviation `jitter`
+                sigma = math.sqrt(math.log(1 + (jitter / mean) ** 2))
+                value = cls.rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+            elif cls.latency_dist == "exponential" and mean > 0:
+                value = cls.rng.expovariate(1 / mean)
+            else:
+                value = mean
+        return max(0.0, value)
+
+    # Status code of an error to inject for this request, or None
+    @classmethod
+    def sample_error(cls):
+        with cls.rng_lock:
+            roll = cls.rng.random()
+        for status, rate in cls.error_rates.items():
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    # Response text and stop reason for a request; a final assistant turn continues a cut-off response
+    @classmethod
+    def respond_text(cls, request):
+        messages = request.get("messages", [])
+        text = None
+        if messages and messages[-1]["role"] == "assistant":
+            key = hashlib.sha256(messages[-1]["content"].encode()).hexdigest()
+            with stats_lock:
+                text = remainders.pop(key, None)
+        if text is None:
+            with cls.rng_lock:
+                text = canned_text(request, cls.rng, cls.wrap_rate)
+        return truncate(text, request.get("max_tokens"))
+
+    # Usage for a response, reporting cache reads and writes for cacheable system blocks
+    def usage(self, request, text):
+        system = request.get("system") or []
+        if isinstance(system, str):
+            system = [{"type": "text", "text": system}]
+        system_tokens = sum(estimate_tokens(block.get("text", "")) for block in system)
+        message_tokens = sum(estimate_tokens(message["content"]) if isinstance(message["content"], str) else 0
+                             for message in request.get("messages", []))
+        usage = {"input_tokens": system_tokens + message_tokens, "output_tokens": estimate_tokens(text)}
+
+        cacheable = (any("cache_control" in block for block in system)
+                     and "prompt-caching" in self.headers.get("anthropic-beta", "")
+                     and system_tokens >= MIN_CACHEABLE_TOKENS)
+        if cacheable:
+            key = hashlib.sha256(json.dumps(system, sort_keys=True).encode()).hexdigest()
+            with stats_lock:
+                hit = key in cached_prefixes
+                cached_prefixes.add(key)
+            usage["input_tokens"] = message_tokens
+            usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = system_tokens
+        return usage
+
+    def do_POST(self):
+        path = self.path.rstrip('/')
+        if path not in ("/v1/messages", "/v1/messages/batches"):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with stats_lock:
+            stats["requests"] += 1
+
+        if path == "/v1/messages/batches":
+            self.submit_batch(request)
+            return
+
+        status = self.sample_error()
+        if status is not None:
+            with stats_lock:
+                stats[status] += 1
+            self.send_api_error(status)
+            return
+
+        text, stop_reason = self.respond_text(request)
+        if request.get("stream"):
+            self.stream_message(request, text, stop_reason)
+            return
+        time.sleep(self.sample_latency())
+        self.send_json(build_message(request.get("model", "mock"), text, self.usage(request, text), stop_reason))
+
+    def submit_batch(self, request):
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        results = []
+        for item in request.get("requests", []):
+            params = item.get("params", {})
+            if self.sample_error() in (500, 529):
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error",
+                                                                                  "message": "Internal server error"}}}
+            else:
+                text, stop_reason = self.respond_text(params)
+                result = {"type": "succeeded",
+                          "message": build_message(params.get("model", "mock"), text, self.usage(params, text),
+                                                   stop_reason)}
+            results.append({"custom_id": item["custom_id"], "result": result})
+        with stats_lock:
+            batches[batch_id] = {"created": time.monotonic(), "results": results}
+            batch = build_batch(batch_id, batches[batch_id], self.base_url(), time.monotonic())
+        self.send_json(batch)
+
+    # Answer a "stream": true request with Messages API server-sent events
+    def stream_message(self, request, text, stop_reason="end_turn"):
+        with stats_lock:
+            stats["streamed"] += 1
+        latency = self.sample_latency()
+        usage = self.usage(request, text)
+        message = build_message(request.get("model", "mock"), "", {**usage, "output_tokens": 1})
+        message["content"] = []
+        message["stop_reason"] = None
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(latency * STREAM_TTFT_SHARE)
+        self.send_event("message_start", {"type": "message_start", "message": message})
+        self.send_event("content_block_start", {"type": "content_block_start", "index": 0,
+                                                "content_block": {"type": "text", "text": ""}})
+        self.send_event("ping", {"type": "ping"})
+        words = text.split(" ")
+        chunks = [" ".join(words[i:i + STREAM_CHUNK_WORDS]) + (" " if i + STREAM_CHUNK_WORDS < len(words) else "")
+                  for i in range(0, len(words), STREAM_CHUNK_WORDS)]
+        for chunk in chunks:
+            time.sleep(latency * (1 - STREAM_TTFT_SHARE) / len(chunks))
+            self.send_event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                    "delta": {"type": "text_delta", "text": chunk}})
+        self.send_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        self.send_event("message_delta", {"type": "message_delta",
+                                          "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                                          "usage": {"output_tokens": usage["output_tokens"]}})
+        self.send_event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_event(self, event, payload):
+        data = f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_api_error(self, status):
+        error_type, message = ERRORS[status]
+        body = json.dumps({"type": "error", "error": {"type": error_type, "message": message}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("retry-after", f"{self.retry_after:g}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts[:3] != ["v1", "messages", "batches"] or len(parts) not in (4, 5):
+            self.send_error(404)
+            return
+
+        with stats_lock:
+            stats["requests"] += 1
+            batch = batches.get(parts[3])
+        if batch is None:
+            self.send_error(404)
+            return
+
+        info = build_batch(parts[3], batch, self.base_url(), time.monotonic())
+        if len(parts) == 4:
+            self.send_json(info)
+            return
+        if parts[4] != "results" or info["processing_status"] != "ended":
+            self.send_error(404)
+            return
+
+        body = "".join(json.dumps(result) + "\n" for result in batch["results"]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-jsonl")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def base_url(self):
+        return f"http://{self.headers.get('Host', '127.0.0.1')}"
+
+    def send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# Apply parsed arguments to the handler
+def configure(args):
+    MockMessagesHandler.latency = args.latency
+    MockMessagesHandler.latency_dist = args.latency_dist
+    MockMessagesHandler.latency_jitter = args.latency_jitter
+    MockMessagesHandler.error_rates = {429: args.rate_limit_rate, 500: args.server_error_rate,
+                                       529: args.overload_rate}
+    MockMessagesHandler.retry_after = args.retry_after
+    MockMessagesHandler.wrap_rate = args.wrap_rate
+    MockMessagesHandler.rng = random.Random(args.seed)
+
+# Run the mock on a background thread; returns the server (call shutdown() to stop it)
+def start_server(args):
+    configure(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockMessagesHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def stats_summary():
+    with stats_lock:
+        return (f"Served {stats['requests']} requests ({stats['streamed']} streamed, {stats['truncated']} cut off at "
+                f"max_tokens) over {stats['connections']} connections; injected {stats[429]} x 429, {stats[500]} x 500, {stats[529]} x 529")
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Run a local mock of the Anthropic Messages API')
+
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on (default: 8080)')
+
+    parser.add_argument('--latency', type=float, default=1.0,
+                        help='Mean seconds to wait before answering each request (default: 1.0)')
+
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='fixed',
+                        help='Distribution response latencies are drawn from (default: fixed)')
+
+    parser.add_argument('--latency-jitter', type=float, default=0.0,
+                        help='Spread of the latency distribution in seconds: the half-width for uniform, '
+                             'the standard deviation for normal and lognormal (default: 0)')
+
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='Share of requests answered with 429 rate_limit_error (default: 0)')
+
+    parser.add_argument('--server-error-rate', type=float, default=0.0,
+                        help='Share of requests answered with 500 api_error (default: 0)')
+
+    parser.add_argument('--overload-rate', type=float, default=0.0,
+                        help='Share of requests answered with 529 overloaded_error (default: 0)')
+
+    parser.add_argument('--retry-after', type=float, default=1.0,
+                        help='retry-after seconds sent with 429 responses (default: 1)')
+
+    parser.add_argument('--wrap-rate', type=float, default=0.3,
+                        help='Share of responses wrapped in a preamble and trailer like the real model adds (default: 0.3)')
+
+    parser.add_argument('--seed', type=int,
+                        help='Seed for latencies, errors and canned content (default: random)')
+
+    args = parser.parse_args(argv)
+    rates = (args.rate_limit_rate, args.server_error_rate, args.overload_rate, args.wrap_rate)
+    if any(not 0 <= rate <= 1 for rate in rates) or sum(rates[:3]) > 1:
+        parser.error('rates must be between 0 and 1, and the error rates must not add up to more than 1')
+    if args.latency < 0 or args.latency_jitter < 0:
+        parser.error('--latency and --latency-jitter cannot be negative')
+    return args
+
+def main():
+    args = parse_arguments()
+    configure(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockMessagesHandler)
+    print(f"Mock Messages API listening on http://{args.host}:{args.port} "
+          f"(latency {args.latency}s {args.latency_dist})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(stats_summary())
+    return 0
+
+if __name__ == "__main__":
+    main()
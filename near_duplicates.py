@@ -0,0 +1,417 @@
+"""Near-duplicate detection across a generated corpus with MinHash and LSH.
+
+Each cleaned document is reduced to a fixed-size MinHash signature over its
+word shingles, using one-permutation hashing: every shingle is hashed once
+and the hash space is split into NUM_HASHES bins, so a signature costs one
+hash per shingle rather than one per shingle and permutation. The share of
+equal bins between two signatures estimates their Jaccard similarity.
+
+Signatures are split into bands, and each band is hashed together with the
+document's platform and type into an LSH bucket key; documents only become
+candidates when they share a bucket, i.e. are of the same type and agree on
+a whole band. Signatures and buckets live in a SQLite file rather than in
+memory, so an index over 100k+ documents stays small in RAM, and candidate
+pairs are checked against their estimated similarity before being reported.
+
+The generator uses the index inline (--dedup) to flag or regenerate
+near-duplicates as they are written; `generate_synthetic_data.py dedup`
+scans an existing output tree, files or packed shards, and writes a report
+of duplicate clusters per platform and type.
+"""
+import argparse
+import array
+import collections
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from content_cleaner import document_location
+from corpus_shards import INDEX_NAME, SHARD_KINDS
+
+# Signature size; a power of two so bins are taken from the top bits of a hash
+NUM_HASHES = 128
+BIN_BITS = 64 - (NUM_HASHES.bit_length() - 1)
+
+# Words per shingle
+SHINGLE_WORDS = 5
+
+DEFAULT_THRESHOLD = 0.8
+
+# What the generator does with a near-duplicate as it is written: nothing, mark it in the manifest,
+# or request it once more and keep the new version
+DEDUP_MODES = ("off", "flag", "regenerate")
+
+# Candidates compared per query; a bucket shared by many copies only needs a few of them checked
+MAX_CANDIDATES = 64
+
+# Documents hashed per batch when scanning a tree, bounding how much text is held at once
+SCAN_BATCH = 2000
+
+DEFAULT_REPORT_PATH = "output/duplicates.json"
+
+WORD_PATTERN = re.compile(r'\w+')
+
+def hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+def shingles(text):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+# One-permutation MinHash signature of `text`, or None if it has no words
+def signature(text):
+    bins = [None] * NUM_HASHES
+    mask = (1 << BIN_BITS) - 1
+    for shingle in shingles(text):
+        value = hash64(shingle.encode("utf-8"))
+        position = value >> BIN_BITS
+        value &= mask
+        if bins[position] is None or value < bins[position]:
+            bins[position] = value
+    if all(value is None for value in bins):
+        return None
+
+    # Empty bins borrow the nearest filled bin to their right, offset by the distance,
+    # so short documents still get comparable signatures
+    filled = bins[:]
+    for position in range(NUM_HASHES):
+        if filled[position] is None:
+            distance = 1
+            while bins[(position + distance) % NUM_HASHES] is None:
+                distance += 1
+            filled[position] = bins[(position + distance) % NUM_HASHES] + distance * (mask + 1)
+    return filled
+
+def similarity(first, second):
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_HASHES
+
+# Rows per band for a threshold: the most selective banding whose S-curve midpoint,
+# (1/bands) ** (1/rows), still sits at or below the threshold, so true matches are rarely missed
+def band_rows(threshold):
+    rows = 1
+    while rows * 2 <= NUM_HASHES and (1 / (NUM_HASHES // (rows * 2))) ** (1 / (rows * 2)) <= threshold:
+        rows *= 2
+    return rows
+
+class NearDuplicateIndex:
+    def __init__(self, path, threshold=DEFAULT_THRESHOLD, reset=False):
+        import sqlite3
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.threshold = threshold
+        self.rows = band_rows(threshold)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                platform TEXT NOT NULL,
+                doc_type TEXT NOT NULL,
+                signature BLOB NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (key INTEGER NOT NULL, doc INTEGER NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS buckets_key ON buckets (key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS buckets_doc ON buckets (doc)")
+        if reset:
+            self.conn.execute("DELETE FROM buckets")
+            self.conn.execute("DELETE FROM docs")
+        self.conn.commit()
+
+    # LSH bucket keys of a signature within its platform and type
+    def bucket_keys(self, platform, doc_type, sig):
+        keys = []
+        for start in range(0, NUM_HASHES, self.rows):
+            band = array.array('Q', sig[start:start + self.rows]).tobytes()
+            data = json.dumps([platform, doc_type, start]).encode("utf-8") + band
+            keys.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True))
+        return keys
+
+    def _signature(self, doc):
+        row = self.conn.execute("SELECT signature FROM docs WHERE doc = ?", (doc,)).fetchone()
+        return array.array('Q', row[0]).tolist()
+
+    # Most similar indexed document of the same platform and type at or above the threshold,
+    # as (id, similarity), or None
+    def nearest(self, platform, doc_type, sig, exclude=None):
+        if sig is None:
+            return None
+        keys = self.bucket_keys(platform, doc_type, sig)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT DISTINCT docs.doc, docs.id FROM buckets JOIN docs ON docs.doc = buckets.doc "
+                f"WHERE buckets.key IN ({','.join('?' * len(keys))}) LIMIT ?",
+                (*keys, MAX_CANDIDATES + 1),
+            ).fetchall()
+            best = None
+            for doc, doc_id in rows:
+                if doc_id == exclude:
+                    continue
+                score = similarity(sig, self._signature(doc))
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (doc_id, score)
+        return best
+
+    # Index a document, replacing any earlier version with the same id
+    def add(self, doc_id, platform, doc_type, sig, commit=True):
+        if sig is None:
+            return
+        keys = self.bucket_keys(platform, doc_type, sig)
+        with self.lock:
+            previous = self.conn.execute("SELECT doc FROM docs WHERE id = ?", (doc_id,)).fetchone()
+            if previous:
+                self.conn.execute("DELETE FROM buckets WHERE doc = ?", previous)
+                self.conn.execute("DELETE FROM docs WHERE doc = ?", previous)
+            doc = self.conn.execute(
+                "INSERT INTO docs (id, platform, doc_type, signature) VALUES (?, ?, ?, ?)",
+                (doc_id, platform, doc_type, array.array('Q', sig).tobytes()),
+            ).lastrowid
+            self.conn.executemany("INSERT INTO buckets (key, doc) VALUES (?, ?)", [(key, doc) for key in keys])
+            if commit:
+                self.conn.commit()
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    # Groups of near-duplicate documents, each a dict with its platform, type, member ids
+    # (earliest indexed first) and the lowest similarity that joined a member to the group
+    def clusters(self):
+        parent = {}
+        weakest = {}
+
+        def find(doc):
+            root = doc
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while parent.get(doc, doc) != root:
+                parent[doc], doc = root, parent[doc]
+            return root
+
+        with self.lock:
+            signatures = collections.OrderedDict()
+            def cached_signature(doc):
+                if doc not in signatures:
+                    signatures[doc] = self._signature(doc)
+                    if len(signatures) > 4096:
+                        signatures.popitem(last=False)
+                return signatures[doc]
+
+            buckets = self.conn.execute(
+                "SELECT group_concat(doc) FROM buckets GROUP BY key HAVING COUNT(*) > 1")
+            for (members,) in buckets:
+                # Each bucket is checked against its first member only, so a large group of copies costs O(n)
+                members = sorted(int(doc) for doc in members.split(","))
+                first = members[0]
+                for doc in members[1:]:
+                    a, b = find(first), find(doc)
+                    if a == b:
+                        continue
+                    score = similarity(cached_signature(first), cached_signature(doc))
+                    if score >= self.threshold:
+                        a, b = min(a, b), max(a, b)
+                        parent[b] = a
+                        weakest[a] = min(score, weakest.get(a, 1.0), weakest.get(b, 1.0))
+
+            groups = collections.defaultdict(list)
+            for doc in list(parent):
+                groups[find(doc)].append(doc)
+            clusters = []
+            for root, members in groups.items():
+                members = sorted(set(members) | {root})
+                rows = self.conn.execute(
+                    f"SELECT id, platform, doc_type FROM docs WHERE doc IN ({','.join('?' * len(members))}) "
+                    f"ORDER BY doc", members).fetchall()
+                clusters.append({"platform": rows[0][1], "doc_type": rows[0][2], "size": len(rows),
+                                 "min_similarity": round(weakest.get(root, 1.0), 3),
+                                 "ids": [row[0] for row in rows]})
+        clusters.sort(key=lambda cluster: (-cluster["size"], cluster["platform"], cluster["doc_type"]))
+        return clusters
+
+    # Number of indexed documents per (platform, type)
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT platform, doc_type, COUNT(*) FROM docs GROUP BY platform, doc_type")
+            return {(platform, doc_type): count for platform, doc_type, count in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+# Documents under an output root as (id, platform, type, content): files, or the documents of packed
+# shards if the root has an index. Platform and type come from the directories right above a document's
+# shard, so a multi-tenant root (<company>/<platform>/<type>/...) is grouped like a single company's
+def iter_documents(root):
+    if os.path.exists(os.path.join(root, INDEX_NAME)):
+        import gzip
+        import tarfile
+        for name in sorted(os.listdir(root)):
+            path = os.path.join(root, name)
+            if name.endswith(SHARD_KINDS["jsonl"]):
+                with gzip.open(path, 'rt', encoding="utf-8") as f:
+                    for line in f:
+                        record = json.loads(line)
+                        location = document_location(record["name"])
+                        if location is not None:
+                            yield (record["name"], *location, record["content"])
+            elif name.endswith(SHARD_KINDS["tar"]):
+                # gzip reads every block of the shard; tarfile's own gz stream stops after the first
+                with gzip.open(path, 'rb') as f, tarfile.open(fileobj=f, mode='r|') as archive:
+                    for member in archive:
+                        location = document_location(member.name) if member.isfile() else None
+                        if location is not None:
+                            yield (member.name, *location, archive.extractfile(member).read().decode("utf-8"))
+        return
+
+    for directory, dirs, names in os.walk(root):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            location = document_location(path)
+            if location is None:
+                continue
+            with open(path, 'r') as f:
+                yield (os.path.relpath(path, root), *location, f.read())
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Index every document under `roots`, hashing batches across `jobs` processes
+def scan(index, roots, jobs=1):
+    documents = ((root, doc_id, platform, doc_type, content)
+                 for root in roots for doc_id, platform, doc_type, content in iter_documents(root))
+    executor = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=jobs)
+    count = 0
+    try:
+        for batch in batched(documents, SCAN_BATCH):
+            contents = [content for *_, content in batch]
+            if executor is None:
+                signatures = map(signature, contents)
+            else:
+                signatures = executor.map(signature, contents, chunksize=max(1, len(contents) // (jobs * 4)))
+            for (root, doc_id, platform, doc_type, _), sig in zip(batch, signatures):
+                index.add(os.path.join(root, doc_id), platform, doc_type, sig, commit=False)
+            index.commit()
+            count += len(batch)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return count
+
+# JSON report: totals, per-type counts and every duplicate cluster
+def build_report(index, clusters, threshold):
+    by_type = {key: {"platform": key[0], "doc_type": key[1], "documents": count, "duplicates": 0, "clusters": 0}
+               for key, count in index.counts().items()}
+    for cluster in clusters:
+        entry = by_type[(cluster["platform"], cluster["doc_type"])]
+        entry["clusters"] += 1
+        entry["duplicates"] += cluster["size"] - 1
+    return {
+        "threshold": threshold,
+        "num_hashes": NUM_HASHES,
+        "band_rows": index.rows,
+        "documents": sum(entry["documents"] for entry in by_type.values()),
+        "duplicates": sum(entry["duplicates"] for entry in by_type.values()),
+        "clusters": len(clusters),
+        "file_types": sorted((entry for entry in by_type.values() if entry["clusters"]),
+                             key=lambda entry: -entry["duplicates"]),
+        "duplicate_clusters": clusters,
+    }
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog='generate_synthetic_data.py dedup',
+                                     description='Find near-duplicate documents in generated output')
+
+    parser.add_argument('paths', nargs='*', default=['output'],
+                        help='Output roots to scan, with per-document files or packed shards (default: output)')
+
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Estimated Jaccard similarity at which documents count as near-duplicates '
+                             f'(default: {DEFAULT_THRESHOLD})')
+
+    parser.add_argument('--report', default=DEFAULT_REPORT_PATH,
+                        help=f'JSON report of duplicate clusters per platform and type (default: {DEFAULT_REPORT_PATH})')
+
+    parser.add_argument('--index',
+                        help='Keep the SQLite signature index at this path (default: a temporary file)')
+
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for hashing (default: number of CPUs)')
+
+    parser.add_argument('--delete', action='store_true',
+                        help='Delete every document of a cluster but the first, so an --incremental run '
+                             'regenerates them; per-document files only')
+
+    args = parser.parse_args(argv)
+    if not 0 < args.threshold <= 1:
+        parser.error('--threshold must be in (0, 1]')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    return args
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    start = time.perf_counter()
+    temporary = None
+    if args.index is None:
+        import tempfile
+        temporary = tempfile.TemporaryDirectory()
+        args.index = os.path.join(temporary.name, "dedup.sqlite3")
+
+    index = NearDuplicateIndex(args.index, args.threshold, reset=True)
+    try:
+        count = scan(index, args.paths, args.jobs)
+        report = build_report(index, index.clusters(), args.threshold)
+    finally:
+        index.close()
+        if temporary is not None:
+            temporary.cleanup()
+
+    directory = os.path.dirname(args.report)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    elapsed = time.perf_counter() - start
+    for entry in report["file_types"]:
+        print(f"{entry['platform']}/{entry['doc_type']}: {entry['duplicates']} near-duplicates in "
+              f"{entry['clusters']} clusters of {entry['documents']} documents")
+    print(f"{report['duplicates']} near-duplicates in {report['clusters']} clusters among {count} documents "
+          f"({elapsed:.2f}s, {count / elapsed if elapsed else 0.0:.0f} docs/s); report written to {args.report}")
+
+    if args.delete:
+        deleted = 0
+        for cluster in report["duplicate_clusters"]:
+            for path in cluster["ids"][1:]:
+                if os.path.isfile(path):
+                    os.remove(path)
+                    deleted += 1
+        print(f"Deleted {deleted} near-duplicate files")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
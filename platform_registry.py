@@ -0,0 +1,157 @@
+"""Data-driven registry of platforms, document types and prompt templates.
+
+file_generation_types.json lists the document types for each platform under
+"<company>_platforms" and, under "platform_rules", the rules that used to be
+hard-coded per platform: which theme keywords and profile sections suit a
+document type (first rule whose "match" substring appears in the type wins),
+per-theme guidance lines, the prompt template to render and, for JSON
+formats, the schema output must satisfy. Templates live in
+prompt_templates/<name>.txt and use string.Template placeholders; schemas
+live in schemas/<name>.json. The rules are shared by every company, so
+templates and guidance refer to whoever a company's representatives deal
+with as $customers / {customers} rather than naming them.
+
+Everything that depends only on the document type is resolved once in
+build_registry(), including the rendered template itself. That text is the
+same for every document of the type and is sent as a cacheable system
+prompt; only the short list of sampled themes varies per document and goes
+in the user message (see render_prompt). A platform without rules gets every
+theme, no profile excerpts and the generic template, so new platforms need
+no code.
+
+Each spec also carries "inputs", hashes of the type-level inputs its
+documents depend on, so --incremental runs can tell which ones went stale.
+"""
+import os
+from string import Template
+
+from input_fingerprints import digest
+from json_validation import load_schema
+from theme_index import ThemeIndex
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_templates")
+DEFAULT_TEMPLATE = "generic_document"
+DEFAULT_THEME_INTRO = ("As you create this document, naturally incorporate the following {count} themes "
+                       "without explicitly labeling them. The content should naturally address these concepts:")
+
+# Human-readable names for output formats, used by the generic template
+FORMAT_NAMES = {".md": "Markdown", ".json": "JSON", ".txt": "plain text", ".csv": "CSV"}
+
+# Value of the first rule whose "match" substrings occur in `text`
+def first_match(rules, text, key):
+    for rule in rules:
+        matches = rule["match"] if isinstance(rule["match"], list) else [rule["match"]]
+        if any(match in text for match in matches):
+            return rule[key]
+    return None
+
+def load_template(name):
+    with open(os.path.join(TEMPLATE_DIR, f"{name}.txt"), 'r') as f:
+        return Template(f.read())
+
+# The company's platform table; a config with a single "*_platforms" key may use any name
+def company_platforms(file_types, platforms_key):
+    if platforms_key in file_types:
+        return file_types[platforms_key]
+    candidates = [key for key in file_types if key.endswith("_platforms")]
+    if len(candidates) == 1:
+        return file_types[candidates[0]]
+    raise KeyError(f"No '{platforms_key}' platform table in file generation types")
+
+# Resolve every platform's document types for one company into ready-to-render specs
+def build_registry(file_types, themes, profile, company):
+    all_rules = file_types.get("platform_rules", {})
+    theme_index = ThemeIndex(themes)
+    templates = {}
+    registry = {}
+
+    for platform, types in company_platforms(file_types, company["platforms_key"]).items():
+        rules = all_rules.get(platform, {})
+        specs = []
+        for file_type in types:
+            doc_type = file_type["type"]
+            format_type = file_type["format"]
+
+            # Themes more likely to be relevant for this document type; all themes if none match
+            keywords = first_match(rules.get("theme_keywords", []), doc_type, "keywords") or []
+
+            # Profile excerpts included in every prompt for this type
+            sections = first_match(rules.get("profile_sections", []), doc_type, "sections") or []
+            specific_content = ""
+            for section in sections:
+                if section in profile:
+                    specific_content += f"\n--- Relevant Info: {section.upper()} ---\n"
+                    specific_content += profile.excerpt(section)  # Truncate to keep prompt reasonable
+                    specific_content += "\n"
+
+            template_name = (file_type.get("template")
+                             or rules.get("templates", {}).get(format_type)
+                             or rules.get("template")
+                             or DEFAULT_TEMPLATE)
+            if template_name not in templates:
+                templates[template_name] = load_template(template_name)
+            system = templates[template_name].substitute(
+                company=company["name"],
+                company_description=company["description"],
+                customers=company["customers"],
+                doc_type=doc_type,
+                platform=platform,
+                format_name=FORMAT_NAMES.get(format_type, format_type.lstrip('.').upper()),
+                specific_content=specific_content,
+            )
+
+            schema_name = file_type.get("schema") or rules.get("schemas", {}).get(format_type)
+            if schema_name:
+                # Fail at startup, not mid-run, if the schema is missing
+                load_schema(schema_name)
+
+            theme_intro = rules.get("theme_intro", DEFAULT_THEME_INTRO)
+            # Guidance is shared by every company, so it names their customers through a placeholder
+            theme_guidance = [{**rule, "text": rule["text"].format(customers=company["customers"])}
+                              for rule in rules.get("theme_guidance", [])]
+            inputs = {
+                "company": digest(company["name"], company["description"], company["customers"]),
+                "profile": digest(specific_content),
+                "template": digest(templates[template_name].template),
+                "file_type": digest(file_type, keywords, sections, theme_intro, theme_guidance),
+                "schema": digest(load_schema(schema_name) if schema_name else None),
+            }
+
+            specs.append({
+                "company": company["name"],
+                "company_slug": company["slug"],
+                "company_description": company["description"],
+                "output": company["output"],
+                "platform": platform,
+                "doc_type": doc_type,
+                "format": format_type,
+                "themes": theme_index.pool(keywords),
+                "sections": [section for section in sections if section in profile],
+                "system": system,
+                "template_name": template_name,
+                "schema_name": schema_name,
+                "theme_intro": theme_intro,
+                "theme_guidance": theme_guidance,
+                "inputs": inputs,
+            })
+        registry[platform] = specs
+
+    return registry
+
+# Render the per-document user message: the themes chosen for it
+def render_prompt(spec, selected_themes):
+    if not selected_themes:
+        return f"Create the {spec['doc_type']} now, following the format and instructions above."
+
+    prompt = spec["theme_intro"].format(count=len(selected_themes)) + "\n"
+    for theme in selected_themes:
+        subtheme = theme['Sub-theme']
+        prompt += f"\n- {theme['Theme Category']}: {subtheme}\n"
+
+        # Add specific guidance related to the theme
+        guidance = first_match(spec["theme_guidance"], subtheme, "text")
+        if guidance:
+            prompt += f"  {guidance}\n"
+
+    prompt += f"\nCreate the {spec['doc_type']} now, following the format and instructions above."
+    return prompt
@@ -0,0 +1,117 @@
+"""Client-side request and token budgets for the generation client.
+
+A RateLimiter holds one token bucket for requests per minute and one for
+tokens per minute. Workers reserve capacity before each API call and sleep
+until their reservation comes due, so a run stays under the account limits
+instead of bouncing off 429s. Server-side throttling (retry-after) pauses
+every worker, not just the one that was rejected.
+"""
+import random
+import threading
+import time
+
+# Status codes worth retrying: timeouts, conflicts, rate limits, server errors and overload (529)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    # Take `amount` now and return how many seconds the caller must wait for it.
+    # The level may go negative; later callers queue up behind the debt.
+    def reserve(self, amount, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.rate
+
+    # Give back (or take more of) a reservation once the real cost is known
+    def adjust(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "throttled_requests": 0,
+            "throttle_seconds": 0.0,
+            "retries": 0,
+            "backoff_seconds": 0.0,
+            "rate_limited_responses": 0,
+        }
+
+    # Block until one request costing `tokens` fits in both budgets
+    def acquire(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.requests:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            self.stats["requests"] += 1
+            if wait > 0:
+                self.stats["throttled_requests"] += 1
+                self.stats["throttle_seconds"] += wait
+        if wait > 0:
+            time.sleep(wait)
+
+    # Correct the token budget once the response reports actual usage
+    def settle(self, estimated_tokens, actual_tokens):
+        if self.tokens:
+            with self.lock:
+                self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    # Record a retry; server-side throttling also holds back every other worker
+    def backoff(self, delay, rate_limited=False):
+        with self.lock:
+            self.stats["retries"] += 1
+            self.stats["backoff_seconds"] += delay
+            if rate_limited:
+                self.stats["rate_limited_responses"] += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        time.sleep(delay)
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        return (f"Rate limiting: {stats['throttled_requests']} of {stats['requests']} requests throttled "
+                f"for {stats['throttle_seconds']:.2f}s total; {stats['retries']} retries "
+                f"({stats['rate_limited_responses']} rate-limited) with {stats['backoff_seconds']:.2f}s of backoff")
+
+# Seconds requested by a retry-after / retry-after-ms header, or None
+def parse_retry_after(headers):
+    if headers is None:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    # email.utils is slow to import and only needed for the rare HTTP-date form
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,115 @@
+"""On-disk cache of Claude responses keyed on the fully rendered request.
+
+Entries live in a single SQLite file and are addressed by a SHA-256 of
+(model, max_tokens, system prompt, prompt, document id), so re-running the
+same documents with byte-identical prompts costs no API calls. Documents
+that happen to share a prompt are cached separately rather than all being
+served the first one's response. The cache is bounded by total size and entry age;
+the least recently used entries are evicted first.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_MODES = ("off", "read", "write", "readwrite")
+
+class ResponseCache:
+    def __init__(self, path, mode="readwrite", max_bytes=None, max_age=None):
+        import sqlite3
+
+        self.path = path
+        self.readable = mode in ("read", "readwrite")
+        self.writable = mode in ("write", "readwrite")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+        if self.writable:
+            self.evict()
+
+    # Content address of a request for one document
+    @staticmethod
+    def key(model, max_tokens, prompt, system=None, document=None):
+        payload = json.dumps([model, max_tokens, system, prompt, document], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # Cached response text for `key`, or None
+    def get(self, key):
+        if not self.readable:
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and self.max_age is not None and row[1] < time.time() - self.max_age:
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            if self.writable:
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+            return row[0]
+
+    def put(self, key, response):
+        if not self.writable:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now),
+            )
+            self.conn.commit()
+            self.stats["writes"] += 1
+
+    # Drop expired entries, then least recently used ones until under the size limit
+    def evict(self):
+        with self.lock:
+            evicted = 0
+            if self.max_age is not None:
+                evicted += self.conn.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+                ).rowcount
+            if self.max_bytes is not None:
+                total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    stale = []
+                    for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                    evicted += len(stale)
+            self.conn.commit()
+            self.stats["evicted"] += evicted
+        return evicted
+
+    def close(self):
+        if self.writable:
+            self.evict()
+        with self.lock:
+            self.conn.close()
+
+    def summary(self):
+        stats = self.stats
+        return (f"Response cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['writes']} writes, {stats['evicted']} evicted ({self.path})")
@@ -0,0 +1,83 @@
+"""Per-run journal of job status, used to resume interrupted runs.
+
+Every job is recorded by its deterministic id as pending when the run is
+planned, then marked done or failed as it finishes, or placeholder when a
+run without an API key wrote a stand-in document. A resumed run skips the
+ids already marked done, so restarting after a crash only re-issues the work
+that never completed, placeholders included. The run's seed is kept alongside, so a resumed run
+replans its unfinished jobs exactly as they were first planned.
+"""
+import os
+import threading
+import time
+
+class RunJournal:
+    def __init__(self, path, reset=False):
+        import sqlite3
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        if reset:
+            self.conn.execute("DELETE FROM jobs")
+            self.conn.execute("DELETE FROM meta")
+        self.conn.commit()
+
+    # Record the seed the run's jobs were planned with
+    def set_seed(self, seed):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seed', ?)", (str(seed),))
+            self.conn.commit()
+
+    # Seed the journaled run was planned with, or None if it predates recording one
+    def run_seed(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'seed'").fetchone()
+        return None if row is None else int(row[0])
+
+    # Record jobs as pending without touching ones already done
+    def add_pending(self, job_ids):
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO jobs (id, status, updated) VALUES (?, 'pending', ?) "
+                "ON CONFLICT(id) DO UPDATE SET status = 'pending', error = NULL, updated = excluded.updated "
+                "WHERE jobs.status != 'done'",
+                [(job_id, now) for job_id in job_ids],
+            )
+            self.conn.commit()
+
+    def mark(self, job_id, status, error=None):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, error, updated) VALUES (?, ?, ?, ?)",
+                (job_id, status, error, time.time()),
+            )
+            self.conn.commit()
+
+    def completed_ids(self):
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT id FROM jobs WHERE status = 'done'")}
+
+    # Number of jobs in each status
+    def counts(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
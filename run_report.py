@@ -0,0 +1,276 @@
+"""Per-stage timing, token usage and cost accounting for a generation run.
+
+Every job runs inside RunReport.job(platform, doc_type), which times it end
+to end and makes it the current job of its thread; stage() timers, token
+usage and retries recorded on that thread are attributed to the job's
+(platform, file type) group. Latencies go into log-bucketed histograms, so
+memory stays constant however many documents a run produces while
+percentiles stay within HISTOGRAM_GROWTH of the true value.
+
+summary() returns a JSON-ready dict (p50/p95/p99 per stage, docs/s,
+tokens/s, errors, retries and estimated cost per platform and file type),
+and ProgressLine prints a periodic one-line status for long runs. Tokens
+of Message Batches results are also counted under "batch_" keys and priced
+at BATCH_DISCOUNT off; continuation requests for truncated batch results
+are direct calls and pay the full rate.
+"""
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Relative width of a histogram bucket, i.e. the worst-case percentile error
+HISTOGRAM_GROWTH = 1.02
+HISTOGRAM_FLOOR = 1e-4
+
+# USD per million tokens: (uncached input, cache write, cache read, output)
+MODEL_PRICES = {
+    "claude-3-5-sonnet-20240620": (3.00, 3.75, 0.30, 15.00),
+    "claude-3-haiku-20240307": (0.25, 0.30, 0.03, 1.25),
+    "claude-3-opus-20240229": (15.00, 18.75, 1.50, 75.00),
+}
+
+# Stages in pipeline order; the report lists them in this order
+STAGES = ("prompt", "rate_limit", "api", "clean", "validate", "dedup", "write", "total")
+
+USAGE_KEYS = ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+
+# Share of the price the Message Batches API takes off every token type
+BATCH_DISCOUNT = 0.5
+BATCH_USAGE_KEYS = tuple(f"batch_{key}" for key in USAGE_KEYS)
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = 0 if seconds <= HISTOGRAM_FLOOR else math.ceil(math.log(seconds / HISTOGRAM_FLOOR, HISTOGRAM_GROWTH))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    # Upper bound of the bucket holding the q-th quantile
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(HISTOGRAM_FLOOR * HISTOGRAM_GROWTH ** bucket, self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 4),
+            "p50": round(self.quantile(0.50), 4),
+            "p95": round(self.quantile(0.95), 4),
+            "p99": round(self.quantile(0.99), 4),
+            "max": round(self.max, 4),
+        }
+
+class RunReport:
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+        self.planned = 0
+        self.stages = {}
+        self.groups = {}
+
+    def _group(self, key):
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {"docs": 0, "errors": 0, "retries": 0, "seconds": 0.0,
+                                        **{usage_key: 0 for usage_key in USAGE_KEYS + BATCH_USAGE_KEYS}}
+        return group
+
+    # Number of jobs this run is expected to process, for progress and ETA
+    def plan(self, count):
+        with self.lock:
+            self.planned += count
+
+    # Time a whole job and attribute everything recorded on this thread meanwhile to its group
+    @contextmanager
+    def job(self, platform, doc_type):
+        key = (platform, doc_type)
+        self.local.key = key
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            with self.lock:
+                self._group(key)["errors"] += 1
+            raise
+        else:
+            self.record("total", time.perf_counter() - start, key)
+            with self.lock:
+                self._group(key)["docs"] += 1
+        finally:
+            self.local.key = None
+
+    # Time one stage of the current job
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, stage, seconds, key=None):
+        key = key or getattr(self.local, "key", None)
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram()
+            histogram.add(seconds)
+            if key is not None and stage != "total":
+                self._group(key)["seconds"] += seconds
+
+    # Count a failed job outside a job() block, e.g. a failed batch request
+    def record_failure(self, platform, doc_type):
+        with self.lock:
+            self._group((platform, doc_type))["errors"] += 1
+
+    # Add a response's token usage to the current job; `batch` for Message Batches results
+    def add_usage(self, usage, batch=False):
+        key = getattr(self.local, "key", None)
+        if key is None:
+            return
+        with self.lock:
+            group = self._group(key)
+            for usage_key, batch_key in zip(USAGE_KEYS, BATCH_USAGE_KEYS):
+                value = usage.get(usage_key) if isinstance(usage, dict) else getattr(usage, usage_key, None)
+                group[usage_key] += value or 0
+                if batch:
+                    group[batch_key] += value or 0
+
+    def add_retry(self):
+        key = getattr(self.local, "key", None)
+        if key is not None:
+            with self.lock:
+                self._group(key)["retries"] += 1
+
+    # Estimated USD cost of the given token counts, with batch tokens at the discounted rate
+    def cost(self, usage):
+        prices = MODEL_PRICES.get(self.model)
+        if prices is None:
+            return None
+        return sum((usage[key] - BATCH_DISCOUNT * usage[batch_key]) * price
+                   for key, batch_key, price in zip(USAGE_KEYS, BATCH_USAGE_KEYS, prices)) / 1e6
+
+    def counts(self):
+        with self.lock:
+            docs = sum(group["docs"] for group in self.groups.values())
+            errors = sum(group["errors"] for group in self.groups.values())
+            tokens = sum(group[key] for group in self.groups.values() for key in USAGE_KEYS)
+            return docs, errors, tokens
+
+    def summary(self):
+        elapsed = time.time() - self.started
+        with self.lock:
+            groups = {key: dict(group) for key, group in self.groups.items()}
+            order = sorted(self.stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES))
+            stages = {name: self.stages[name].summary() for name in order}
+
+        totals = {"docs": 0, "errors": 0, "retries": 0, **{key: 0 for key in USAGE_KEYS + BATCH_USAGE_KEYS}}
+        by_type = []
+        platforms = {}
+        for (platform, doc_type), group in sorted(groups.items()):
+            for key in totals:
+                totals[key] += group[key]
+            platform_totals = platforms.setdefault(platform, {key: 0 for key in totals})
+            for key in totals:
+                platform_totals[key] += group[key]
+            by_type.append({"platform": platform, "doc_type": doc_type, **group,
+                            "seconds": round(group["seconds"], 3), "cost_usd": self._round(self.cost(group))})
+        for platform_totals in platforms.values():
+            platform_totals["cost_usd"] = self._round(self.cost(platform_totals))
+
+        tokens = sum(totals[key] for key in USAGE_KEYS)
+        return {
+            "model": self.model,
+            "started": self.started,
+            "elapsed_seconds": round(elapsed, 3),
+            "planned": self.planned,
+            **totals,
+            "docs_per_second": round(totals["docs"] / elapsed, 3) if elapsed else None,
+            "tokens_per_second": round(tokens / elapsed, 1) if elapsed else None,
+            "cost_usd": self._round(self.cost(totals)),
+            "stages": stages,
+            "platforms": platforms,
+            "file_types": by_type,
+        }
+
+    @staticmethod
+    def _round(cost):
+        return None if cost is None else round(cost, 4)
+
+    # Write summary() as JSON, atomically
+    def write(self, path, extra=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({**self.summary(), **(extra or {})}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    # Human-readable latency table
+    def format_stages(self):
+        lines = [f"{'stage':>10} {'count':>8} {'p50':>9} {'p95':>9} {'p99':>9}"]
+        for name, stats in self.summary()["stages"].items():
+            if stats["count"]:
+                lines.append(f"{name:>10} {stats['count']:>8} {stats['p50']:>8.3f}s {stats['p95']:>8.3f}s "
+                             f"{stats['p99']:>8.3f}s")
+        return "\n".join(lines)
+
+# Background thread printing a one-line status every `interval` seconds
+class ProgressLine:
+    def __init__(self, report, interval=5.0, stream=sys.stderr):
+        self.report = report
+        self.interval = interval
+        self.stream = stream
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self._print(final=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self._print()
+
+    def _print(self, final=False):
+        docs, errors, tokens = self.report.counts()
+        elapsed = time.time() - self.report.started
+        rate = docs / elapsed if elapsed else 0.0
+        planned = self.report.planned
+        remaining = planned - docs - errors
+        eta = f", ETA {remaining / rate:.0f}s" if rate and remaining > 0 else ""
+        line = (f"[{docs + errors}/{planned}] {docs} done, {errors} failed, {rate:.2f} docs/s, "
+                f"{tokens / elapsed if elapsed else 0.0:.0f} tokens/s{eta}")
+        if self.stream.isatty():
+            self.stream.write(f"\r{line}\033[K" + ("\n" if final else ""))
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
@@ -0,0 +1,142 @@
+"""Incremental cleanup and atomic writing of streamed responses.
+
+StreamingCleaner applies the patterns of content_cleaner one line at a
+time, so a response can be written to disk while it is still arriving:
+leading "Here's a ..." preambles and Markdown fences are dropped, JSON is cut
+to the first fenced block or to the outermost object or array, and anything
+from a trailing "This JSON/document provides..." line onwards is discarded.
+Only the current partial line and text that may still be trimmed are held in
+memory.
+"""
+import os
+import time
+
+from content_cleaner import (DEFAULT_PREAMBLE_PATTERN, JSON_FENCE_PATTERN, MARKDOWN_FENCE_PATTERN, PREAMBLE_PATTERNS,
+                             TRAILER_PATTERN, json_start)
+
+class StreamingCleaner:
+    def __init__(self, format_type):
+        self.format_type = format_type
+        self.preamble = PREAMBLE_PATTERNS.get(format_type, DEFAULT_PREAMBLE_PATTERN)
+        self.partial = ""
+        self.held = ""
+        self.started = False
+        self.done = False
+        # JSON extraction state: None while looking, then "fenced" or "braces"
+        self.json_mode = None
+        self.closer = '}'
+        self.unmatched = []
+
+    # Clean the complete lines in `text` and return what can be written now
+    def feed(self, text):
+        self.partial += text
+        lines = self.partial.split("\n")
+        self.partial = lines.pop()
+        return "".join(self._line(line + "\n") for line in lines)
+
+    # Flush the final partial line and drop anything held back for trimming
+    def finish(self):
+        out = self._line(self.partial) if self.partial else ""
+        self.partial = ""
+        if self.format_type == ".json" and self.json_mode is None:
+            # No JSON found: fall back to the general cleanup over what was seen
+            self.format_type = None
+            for line in self.unmatched:
+                out += self._line(line)
+        self.held = ""
+        return out
+
+    def _line(self, line):
+        if self.done:
+            return ""
+        if self.format_type == ".json":
+            return self._json_line(line)
+        if self.started and TRAILER_PATTERN.match(line):
+            self.done = True
+            return ""
+        if self.format_type == ".md":
+            line = MARKDOWN_FENCE_PATTERN.sub('', line)
+        if not self.started:
+            line = self.preamble.sub('', line.lstrip(), count=1)
+        return self._emit(line)
+
+    def _json_line(self, line):
+        if self.json_mode is None:
+            fence = JSON_FENCE_PATTERN.search(line)
+            brace = json_start(line)
+            if fence and (brace < 0 or fence.start() < brace):
+                self.json_mode = "fenced"
+                line = line[fence.end():]
+            elif brace >= 0:
+                self.json_mode = "braces"
+                self.closer = '}' if line[brace] == '{' else ']'
+                line = line[brace:]
+            else:
+                self.unmatched.append(line)
+                return ""
+
+        if self.json_mode == "fenced":
+            end = line.find('```')
+            if end >= 0:
+                self.done = True
+                line = line[:end]
+            return self._emit(line)
+
+        # Everything after the latest closer is held back until another one arrives
+        close = line.rfind(self.closer)
+        if close < 0:
+            self.held += line
+            return ""
+        out = self._emit(line[:close + 1])
+        self.held = line[close + 1:]
+        return out
+
+    # Emit text with leading whitespace of the document trimmed and trailing whitespace held back
+    def _emit(self, text):
+        if not self.started:
+            text = self.held + text
+            self.held = ""
+            text = text.lstrip()
+            if not text:
+                return ""
+            self.started = True
+        body = text.rstrip()
+        if not body:
+            self.held += text
+            return ""
+        out = self.held + body
+        self.held = text[len(body):]
+        return out
+
+# Write cleaned chunks to `filename` via a temp file that is renamed into place at the end.
+# Returns (seconds to first chunk, bytes written), timed from `start` (a time.perf_counter()
+# value taken before the request was sent) or else from the call.
+def stream_to_file(chunks, filename, format_type, start=None):
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    cleaner = StreamingCleaner(format_type)
+    tmp_path = f"{filename}.part"
+    if start is None:
+        start = time.perf_counter()
+    first_chunk = None
+    size = 0
+    try:
+        with open(tmp_path, 'w') as f:
+            for chunk in chunks:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+                out = cleaner.feed(chunk)
+                if out:
+                    f.write(out)
+                    f.flush()
+                    size += len(out.encode("utf-8"))
+            out = cleaner.finish()
+            f.write(out)
+            size += len(out.encode("utf-8"))
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return first_chunk, size
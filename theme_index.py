@@ -0,0 +1,81 @@
+"""Theme lookup and weighted sampling built once at load time.
+
+ThemeIndex maps each keyword to the ids of the themes whose category or
+sub-theme contains it (the same substring test the per-type rules always
+used). Each keyword is scanned once and then answered from the index, and
+each distinct keyword set becomes a ThemePool with precomputed cumulative
+weights. Sampling k themes from a pool is O(k log n) instead of a scan over
+every theme per document.
+
+Themes may carry an optional "Weight" column in generation_themes.csv; a
+missing or empty weight counts as 1 and a weight of 0 excludes the theme.
+"""
+import bisect
+import itertools
+
+class ThemePool:
+    def __init__(self, themes, weights):
+        self.themes = themes
+        self.weights = weights
+        self.cumulative = list(itertools.accumulate(weights))
+        self.total = self.cumulative[-1] if self.cumulative else 0.0
+        self.size = sum(1 for weight in weights if weight > 0)
+
+    def __len__(self):
+        return self.size
+
+    # Draw up to k distinct themes, each with probability proportional to its weight
+    def sample(self, rng, k):
+        k = min(k, self.size)
+        chosen = []
+        seen = set()
+        attempts = 0
+        while len(chosen) < k and attempts < 8 * k:
+            attempts += 1
+            position = bisect.bisect_right(self.cumulative, rng.random() * self.total)
+            position = min(position, len(self.themes) - 1)
+            if position not in seen and self.weights[position] > 0:
+                seen.add(position)
+                chosen.append(self.themes[position])
+        if len(chosen) < k:
+            # Heavily skewed weights keep hitting the same themes; finish with an exact draw
+            remaining = [i for i, weight in enumerate(self.weights) if weight > 0 and i not in seen]
+            while len(chosen) < k:
+                weights = [self.weights[i] for i in remaining]
+                position = rng.choices(range(len(remaining)), weights=weights)[0]
+                chosen.append(self.themes[remaining.pop(position)])
+        return chosen
+
+class ThemeIndex:
+    def __init__(self, themes):
+        self.themes = themes
+        self.weights = [theme_weight(theme) for theme in themes]
+        self.keyword_ids = {}
+        self.pools = {}
+        self.all_themes = ThemePool(themes, self.weights)
+
+    # Ids of the themes whose category or sub-theme contains `keyword`
+    def lookup(self, keyword):
+        ids = self.keyword_ids.get(keyword)
+        if ids is None:
+            ids = frozenset(
+                theme_id for theme_id, theme in enumerate(self.themes)
+                if keyword in theme['Theme Category'] or keyword in theme['Sub-theme']
+            )
+            self.keyword_ids[keyword] = ids
+        return ids
+
+    # Pool of themes matching any of `keywords`; every theme when none match
+    def pool(self, keywords):
+        key = tuple(sorted(set(keywords)))
+        if key not in self.pools:
+            ids = sorted(set().union(*(self.lookup(keyword) for keyword in key))) if key else []
+            if ids:
+                self.pools[key] = ThemePool([self.themes[i] for i in ids], [self.weights[i] for i in ids])
+            else:
+                self.pools[key] = self.all_themes
+        return self.pools[key]
+
+def theme_weight(theme):
+    weight = (theme.get('Weight') or '').strip()
+    return float(weight) if weight else 1.0
@@ -0,0 +1,134 @@
+"""Per-document-type max_tokens budgets learned from observed output lengths.
+
+Every finished response records its output token count, continuations
+included, under its (platform, document type). Once a type has MIN_SAMPLES
+observations its budget is the p95 of its last WINDOW counts plus HEADROOM,
+rounded up to BUDGET_STEP and clamped to [MIN_MAX_TOKENS, MAX_OUTPUT_TOKENS];
+until then requests use the default. A response that still runs into its
+budget is continued rather than regenerated, so a budget that is too tight
+costs one short extra request, not a discarded document.
+
+Each request reserves prompt tokens plus max_tokens from the client-side
+token bucket before it is sent, so short types sized at the flat default
+held back far more of a --tpm budget than they ever used.
+
+History is kept in a JSON file next to the run output. save() merges this
+process's new observations into whatever is on disk, so later runs and
+concurrent workers start from everything earlier ones saw.
+"""
+import json
+import math
+import os
+import threading
+
+# Observations needed before a type's budget is learned rather than the default
+MIN_SAMPLES = 5
+
+# Most recent observations kept per type
+WINDOW = 200
+
+# Margin over the p95 output length
+HEADROOM = 1.25
+
+BUDGET_STEP = 64
+MIN_MAX_TOKENS = 256
+
+# Largest max_tokens the model accepts; continuations always ask for this much
+MAX_OUTPUT_TOKENS = 4096
+
+def p95(counts):
+    ordered = sorted(counts)
+    return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)] if ordered else None
+
+class TokenBudgets:
+    def __init__(self, path=None, default=2500, fixed=None):
+        self.path = path
+        self.default = default
+        self.fixed = fixed
+        self.lock = threading.Lock()
+        self.history = {}
+        self.new = {}
+        self.budgets = {}
+        self.stats = {"responses": 0, "truncated": 0, "continuations": 0, "incomplete": 0}
+        if path and os.path.exists(path):
+            self.history = self._load(path)
+
+    @staticmethod
+    def _load(path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return {(platform, doc_type): counts
+                for platform, types in data.get("output_tokens", {}).items()
+                for doc_type, counts in types.items()}
+
+    # max_tokens for the next request of a (platform, doc_type) kind
+    def max_tokens(self, kind=None):
+        if self.fixed is not None:
+            return self.fixed
+        with self.lock:
+            budget = self.budgets.get(kind)
+            if budget is None:
+                budget = self.budgets[kind] = self._budget(self.history.get(kind, []))
+        return budget
+
+    def _budget(self, counts):
+        if len(counts) < MIN_SAMPLES:
+            return self.default
+        budget = math.ceil(p95(counts) * HEADROOM / BUDGET_STEP) * BUDGET_STEP
+        return max(MIN_MAX_TOKENS, min(MAX_OUTPUT_TOKENS, budget))
+
+    # Record a finished response: its total output tokens, how many continuations it took
+    # and whether it still ended at the token limit
+    def observe(self, kind, output_tokens, continuations=0, complete=True):
+        with self.lock:
+            self.stats["responses"] += 1
+            self.stats["truncated"] += 1 if continuations or not complete else 0
+            self.stats["continuations"] += continuations
+            self.stats["incomplete"] += 0 if complete else 1
+            if kind is None:
+                return
+            for counts in (self.history.setdefault(kind, []), self.new.setdefault(kind, [])):
+                counts.append(output_tokens)
+                del counts[:-WINDOW]
+            # Relearn from time to time as observations arrive
+            if len(self.history[kind]) % MIN_SAMPLES == 0:
+                self.budgets.pop(kind, None)
+
+    # Merge this process's observations into the history file, atomically
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            merged = self._load(self.path) if os.path.exists(self.path) else {}
+            for kind, counts in self.new.items():
+                merged[kind] = (merged.get(kind, []) + counts)[-WINDOW:]
+            self.new = {}
+        data = {}
+        for (platform, doc_type), counts in sorted(merged.items()):
+            data.setdefault(platform, {})[doc_type] = counts
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"output_tokens": data}, f)
+        os.replace(tmp_path, self.path)
+
+    # Current budget, sample count and p95 per type, for the run report
+    def snapshot(self):
+        with self.lock:
+            history = {kind: list(counts) for kind, counts in self.history.items()}
+        types = []
+        for (platform, doc_type), counts in sorted(history.items()):
+            types.append({"platform": platform, "doc_type": doc_type, "samples": len(counts), "p95": p95(counts),
+                          "max_tokens": self.fixed if self.fixed is not None else self._budget(counts)})
+        with self.lock:
+            return {**self.stats, "default": self.default, "fixed": self.fixed, "file_types": types}
+
+    def summary(self):
+        snapshot = self.snapshot()
+        learned = [entry["max_tokens"] for entry in snapshot["file_types"] if entry["samples"] >= MIN_SAMPLES]
+        budgets = f", budgets {min(learned)}-{max(learned)}" if learned and self.fixed is None else ""
+        return (f"Token budgets: {len(learned)} of {len(snapshot['file_types'])} types learned{budgets}; "
+                f"{snapshot['truncated']} of {snapshot['responses']} responses hit max_tokens, "
+                f"{snapshot['continuations']} continuations, {snapshot['incomplete']} still incomplete")